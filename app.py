@@ -1,15 +1,35 @@
 import streamlit as st
 from datetime import datetime, timedelta, timezone
 import pandas as pd
+import numpy as np
 import plotly.express as px
+import plotly.graph_objects as go
 import openai
 import os
 import streamlit.components.v1 as components
 import base64
+import hashlib
+import json
+import sqlite3
 import ast
-from PIL import Image
+from PIL import Image, features
 import io
+import time
+import threading
+import uuid
+import bisect
+from itertools import islice
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import closing
+from functools import partial
 from supabase import create_client, Client
+from trade_history import TradeHistory, history_column, history_frame
+
+try:
+    import duckdb # Optional columnar analytics backend for large premium histories
+except ImportError:
+    duckdb = None
 
 # --- 0. Constants & Config ---
 COLOR_WIN = '#FF4B4B'
@@ -17,6 +37,32 @@ COLOR_LOSS = '#4C78A8'
 COLOR_BE = '#808080'
 COLOR_PROFIT = '#2E7D32'
 
+# Dashboard only needs scalar columns; heavy text fields are loaded per trade on demand
+SUMMARY_COLUMNS = "id, client_id, user_id, entry_time, exit_time, ticker, strategy_name, mood, start_balance, final_balance, profit, roi, result_status, satisfaction, chart_url, duration_minutes"
+# Same projection for databases without sql/trades_client_id.sql applied yet
+LEGACY_SUMMARY_COLUMNS = SUMMARY_COLUMNS.replace(" client_id,", "")
+DETAIL_COLUMNS = ["strategy_detail", "review", "memos", "ai_feedback"]
+# Same fields for databases without sql/trades_ai_feedback.sql applied yet
+LEGACY_DETAIL_COLUMNS = [col for col in DETAIL_COLUMNS if col != "ai_feedback"]
+# Archived trades of non-premium users are only fetched as key stubs (no trade content)
+ARCHIVE_COLUMNS = "id, entry_time"
+RECENT_LIMIT = 20
+
+# Chart screenshot encoding policies
+# effort: encoder speed preset 0 (fastest) - 6 (smallest), WebP `method` / AVIF `speed` = 10 - effort
+# passthrough_max_bytes: already-small WebP/JPEG inputs within max_dimension are uploaded as-is
+IMAGE_POLICIES = {
+    "high_quality": {"max_dimension": None, "format": "WEBP", "lossless": True, "quality": 100, "effort": 4, "passthrough_max_bytes": 0},
+    "fast": {"max_dimension": 2560, "format": "WEBP", "lossless": False, "quality": 85, "effort": 2, "passthrough_max_bytes": 1_500_000},
+    "compact": {"max_dimension": 2560, "format": "AVIF", "lossless": False, "quality": 70, "effort": 2, "passthrough_max_bytes": 1_500_000},
+}
+CHART_IMAGE_POLICY = "fast"
+# Downsized copies stored next to the original: charts/<sha256 of source>/{original.<ext>, preview.webp, thumb.webp}
+CHART_VARIANTS = {"preview": 1280, "thumb": 320}
+CHART_VARIANT_POLICY = {"format": "WEBP", "lossless": False, "quality": 80, "effort": 2}
+IMAGE_MIME_TYPES = {"WEBP": "image/webp", "JPEG": "image/jpeg", "AVIF": "image/avif", "PNG": "image/png"}
+HISTORY_PAGE_SIZE = 1000 # PostgREST default max-rows
+
 st.set_page_config(page_title="Trading Dashboard", layout="wide")
 
 # --- 1. Timezone Setup (KST) ---
@@ -490,6 +536,51 @@ if "history" not in st.session_state:
 if "full_history" not in st.session_state:
     st.session_state.full_history = []
 
+if "trade_vocab" not in st.session_state:
+    st.session_state.trade_vocab = None
+
+if "trade_details" not in st.session_state:
+    st.session_state.trade_details = {}
+
+if "chart_upload" not in st.session_state:
+    st.session_state.chart_upload = None
+
+if "pending_chart_patches" not in st.session_state:
+    st.session_state.pending_chart_patches = []
+
+if "columnar_store" not in st.session_state:
+    st.session_state.columnar_store = None
+
+if "local_pending" not in st.session_state:
+    st.session_state.local_pending = set() # client_ids of local saves still waiting for their server id
+
+if "client_id_column" not in st.session_state:
+    st.session_state.client_id_column = True # Cleared when the trades table has no client_id column yet
+
+if "ai_feedback_column" not in st.session_state:
+    st.session_state.ai_feedback_column = True # Cleared when the trades table has no ai_feedback column yet
+
+if "local_failed" not in st.session_state:
+    st.session_state.local_failed = set() # client_ids of local saves the server rejected
+
+if "coach_request" not in st.session_state:
+    st.session_state.coach_request = None
+
+if "history_backfill" not in st.session_state:
+    st.session_state.history_backfill = None
+
+if "kpi_rpc_available" not in st.session_state:
+    st.session_state.kpi_rpc_available = True
+
+if "history_version" not in st.session_state:
+    st.session_state.history_version = 0
+
+if "analytics_frame" not in st.session_state:
+    st.session_state.analytics_frame = None
+
+if "last_trade_id" not in st.session_state:
+    st.session_state.last_trade_id = None
+
 if "user_id" not in st.session_state:
     st.session_state.user_id = ""
 
@@ -508,62 +599,426 @@ def init_supabase():
         st.error(f"Supabase Init Error: {e}")
         return None
 
-def optimize_image_high_quality(uploaded_file):
+@st.cache_resource
+def get_background_executor():
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="trading-journal")
+
+def encode_image(image, policy):
+    image_format = policy["format"]
+    if image_format == "AVIF" and not features.check("avif"):
+        image_format = "WEBP"
+    output_io = io.BytesIO()
+    if image_format == "AVIF":
+        image.save(output_io, format="AVIF", quality=policy["quality"], speed=10 - policy["effort"])
+    else:
+        image.save(output_io, format="WEBP", lossless=policy["lossless"], quality=policy["quality"], method=policy["effort"])
+    output_io.seek(0)
+    return output_io, image_format
+
+def optimize_chart_image(uploaded_file, policy_name=CHART_IMAGE_POLICY):
+    # Returns (BytesIO, format, error) per IMAGE_POLICIES; (None, None, message) on failure.
+    # Runs on the background executor -> no st.* calls in here
+    policy = IMAGE_POLICIES[policy_name]
     try:
-        image = Image.open(uploaded_file)
+        uploaded_file.seek(0)
+        source_bytes = uploaded_file.read()
+        image = Image.open(io.BytesIO(source_bytes)) # Lazy: only the header is decoded here
+        source_format = image.format
+        max_dim = policy["max_dimension"]
+        fits = max_dim is None or max(image.size) <= max_dim
+        if image.format in ("WEBP", "JPEG") and fits and len(source_bytes) <= policy["passthrough_max_bytes"]:
+            return io.BytesIO(source_bytes), image.format, None
         if image.mode in ("RGBA", "P"):
             image = image.convert("RGB")
-        output_io = io.BytesIO()
-        image.save(output_io, format="WEBP", lossless=True, quality=100) 
-        output_io.seek(0)
-        return output_io
+        if not fits:
+            image.thumbnail((max_dim, max_dim), Image.Resampling.LANCZOS, reducing_gap=2.0)
+        output_io, image_format = encode_image(image, policy)
+        # Never upload a re-encode that is bigger than an already web-friendly source
+        if fits and source_format in IMAGE_MIME_TYPES and output_io.getbuffer().nbytes >= len(source_bytes):
+            return io.BytesIO(source_bytes), source_format, None
+        return output_io, image_format, None
     except Exception as e:
-        st.error(f"Image Optimization Error: {e}")
-        return None
+        return None, None, f"Image Optimization Error: {e}"
 
-def upload_image_to_supabase(supabase: Client, image_file, bucket_name="trade_images"):
+def make_chart_variants(file_bytes):
+    # Preview / thumbnail copies for the detail panel and the history table; returns (variants, error)
+    variants = {}
     try:
-        filename = f"chart_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.urandom(4).hex()}.webp"
-        mime_type = "image/webp"
+        image = Image.open(io.BytesIO(file_bytes))
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        for variant, max_dim in CHART_VARIANTS.items():
+            resized = image.copy()
+            resized.thumbnail((max_dim, max_dim), Image.Resampling.LANCZOS, reducing_gap=2.0)
+            variants[variant] = encode_image(resized, CHART_VARIANT_POLICY)
+    except Exception as e:
+        return {}, f"Image Variant Error: {e}" # All or nothing: a partial set would leave the folder without some variants
+    return variants, None
+
+def chart_variant_url(chart_url, variant):
+    # Legacy single-file uploads have no variants -> fall back to the original
+    if not isinstance(chart_url, str) or "/charts/" not in chart_url or "/original." not in chart_url:
+        return chart_url
+    return chart_url.rsplit("/original.", 1)[0] + f"/{variant}.webp"
+
+def upload_image_to_supabase(supabase: Client, image_file, bucket_name="trade_images", image_format="WEBP", filename=None):
+    # Returns (public URL, error); (None, message) on failure
+    try:
+        extension = "jpg" if image_format == "JPEG" else image_format.lower()
+        if filename is None:
+            filename = f"chart_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.urandom(4).hex()}"
+        filename = f"{filename}.{extension}"
+        mime_type = IMAGE_MIME_TYPES.get(image_format, "image/webp")
         image_file.seek(0)
         file_bytes = image_file.read() 
         res = supabase.storage.from_(bucket_name).upload(
             path=filename,
             file=file_bytes,
-            file_options={"content-type": mime_type}
+            file_options={"content-type": mime_type, "upsert": "true"}
         )
-        return supabase.storage.from_(bucket_name).get_public_url(filename)
+        return supabase.storage.from_(bucket_name).get_public_url(filename), None
     except Exception as e:
-        st.error(f"Supabase Upload Error: {e}")
-        return None
+        return None, f"Supabase Upload Error: {e}"
 
-def load_data_from_supabase(supabase: Client, user_id):
+def find_uploaded_chart(supabase: Client, folder, bucket_name="trade_images"):
+    # Existence check for a content-addressed folder: reused only when original.* and every variant are stored
+    # (folders from older uploads may hold an original whose variants failed)
+    try:
+        names = {obj.get("name", "") for obj in supabase.storage.from_(bucket_name).list(folder, {"limit": 100}) or []}
+    except Exception:
+        return None
+    original = next((name for name in names if name.startswith("original.")), None)
+    if original is None or any(f"{variant}.webp" not in names for variant in CHART_VARIANTS):
+        return None
+    return supabase.storage.from_(bucket_name).get_public_url(f"{folder}/{original}")
+
+def process_chart_upload(supabase: Client, file_bytes):
+    # Runs on the background executor: encode + upload, returns (public URL, error); the caller reports the error
+    folder = f"charts/{hashlib.sha256(file_bytes).hexdigest()}"
+    existing_url = find_uploaded_chart(supabase, folder)
+    if existing_url: return existing_url, None # Same screenshot already stored -> no encode, no transfer
+    optimized_io, image_format, error = optimize_chart_image(io.BytesIO(file_bytes))
+    if optimized_io is None: return None, error
+    variants, error = make_chart_variants(file_bytes)
+    if error: return None, error
+    for variant, (variant_io, variant_format) in variants.items():
+        url, error = upload_image_to_supabase(supabase, variant_io, bucket_name="trade_images", image_format=variant_format, filename=f"{folder}/{variant}")
+        if url is None: return None, error # No original -> the folder is never reused as a complete set
+    # original.* goes last, only once every variant is stored
+    return upload_image_to_supabase(supabase, optimized_io, bucket_name="trade_images", image_format=image_format, filename=f"{folder}/original")
+
+def start_chart_upload(supabase: Client, uploaded_file):
+    # Kick off encoding/upload as soon as the file is attached (once per attached file)
+    upload = st.session_state.chart_upload
+    if upload is not None and upload["file_id"] == uploaded_file.file_id: return upload
+    upload = {
+        "file_id": uploaded_file.file_id,
+        "future": get_background_executor().submit(process_chart_upload, supabase, uploaded_file.getvalue()),
+    }
+    st.session_state.chart_upload = upload
+    return upload
+
+def chart_upload_result(future):
+    # (url, error) of a finished upload future; an unexpected worker exception becomes the error
+    if future.exception() is not None:
+        return None, f"Chart Upload Error: {future.exception()}"
+    return future.result()
+
+def patch_trade_chart_url(ref, user_id, future):
+    # Done-callback on the worker thread: queue the chart_url patch for the already-saved row
+    try:
+        url, _ = chart_upload_result(future)
+        if url:
+            enqueue_write("update", "trades", {"chart_url": url}, match=ref, user_id=user_id, client_id=ref.get("client_id"))
+    except Exception:
+        pass # Row stays without a chart; the upload error is shown on the next rerun
+
+def apply_chart_url_patches():
+    # Mirror finished background uploads into the local history / current trade
+    pending = []
+    for ref, future in st.session_state.pending_chart_patches:
+        if not future.done():
+            pending.append((ref, future))
+            continue
+        url, error = chart_upload_result(future)
+        if not url:
+            st.error(f"Chart upload failed. The trade was saved without an image. ({error})")
+            continue
+        history = [dict(row, chart_url=url) if matches_trade_ref(row, ref) else row for row in st.session_state.full_history]
+        set_session_history(history)
+        if matches_trade_ref(st.session_state.trade_data, ref):
+            st.session_state.trade_data["chart_url"] = url
+    st.session_state.pending_chart_patches = pending
+
+def normalize_trade_row(row):
+    if "memos" in row and isinstance(row["memos"], str):
+         try: row["memos"] = ast.literal_eval(row["memos"])
+         except: row["memos"] = []
+    if "strategy_name" not in row or not row["strategy_name"]:
+        row["strategy_name"] = "General"
+    if "ticker" not in row or not row["ticker"]:
+        row["ticker"] = "Unknown"
+    return row
+
+def summary_columns():
+    return SUMMARY_COLUMNS if st.session_state.client_id_column else LEGACY_SUMMARY_COLUMNS
+
+def is_undefined_column(e):
+    return str(getattr(e, "code", "") or "") == "42703"
+
+def select_with_summary_columns(fetch):
+    # fetch(columns) -> rows. Before sql/trades_client_id.sql is applied, selecting client_id fails with 42703
+    # (undefined column): remember that for the session and select without it
     try:
-        response = supabase.table("trades") \
-            .select("*") \
-            .eq("user_id", user_id) \
-            .order("entry_time", desc=False) \
-            .execute()
-        data = response.data
-        if not data: return [], []
+        return fetch(summary_columns())
+    except Exception as e:
+        if not is_undefined_column(e) or not st.session_state.client_id_column: raise
+        st.session_state.client_id_column = False
+        return fetch(summary_columns())
+
+def load_data_from_supabase(supabase: Client, user_id, after_id=None):
+    # after_id: server id high-water mark -> only rows inserted after it are fetched (incremental sync).
+    # Not entry_time: trades are inserted when closed, so one opened earlier can arrive after a newer one
+    def fetch(columns):
+        query = supabase.table("trades") \
+            .select(columns) \
+            .eq("user_id", user_id)
+        if after_id is not None:
+            query = query.gt("id", after_id)
+        return query.order("entry_time", desc=False).order("id", desc=False).execute().data
+    try:
+        data = select_with_summary_columns(fetch)
         for row in data:
-            if "memos" in row and isinstance(row["memos"], str):
-                 try: row["memos"] = ast.literal_eval(row["memos"])
-                 except: row["memos"] = []
-            if "strategy_name" not in row or not row["strategy_name"]:
-                row["strategy_name"] = "General"
-            if "ticker" not in row or not row["ticker"]:
-                row["ticker"] = "Unknown"
-        full_history = data
-        recent_history = full_history[-20:] if len(full_history) > 20 else full_history
-        return full_history, recent_history
+            normalize_trade_row(row)
+        return data
+    except Exception as e:
+        st.error(f"Data Load Error: {e}")
+        return []
+
+def page_cursor(row):
+    # Keyset cursor: (entry_time, id) -> trades sharing an entry_time never straddle a page boundary
+    return (row.get("entry_time"), row.get("id"))
+
+def fetch_trades_page(supabase: Client, user_id, before=None, limit=HISTORY_PAGE_SIZE, columns=SUMMARY_COLUMNS):
+    # Keyset page: newest `limit` trades strictly before the `before` cursor, returned oldest-first
+    query = supabase.table("trades").select(columns).eq("user_id", user_id)
+    if before:
+        entry_time, trade_id = before
+        if trade_id is None:
+            query = query.lt("entry_time", entry_time)
+        else:
+            query = query.or_(f'entry_time.lt."{entry_time}",and(entry_time.eq."{entry_time}",id.lt.{int(trade_id)})')
+    rows = query.order("entry_time", desc=True).order("id", desc=True).limit(limit).execute().data or []
+    rows.reverse()
+    if columns != ARCHIVE_COLUMNS:
+        for row in rows:
+            normalize_trade_row(row)
+    return rows
+
+def backfill_older_trades(supabase: Client, user_id, before, columns):
+    # Runs on the background executor -> no st.* calls in here
+    pages = []
+    while before[0]:
+        page = fetch_trades_page(supabase, user_id, before=before, columns=columns)
+        if not page: break
+        pages.insert(0, page)
+        if len(page) < HISTORY_PAGE_SIZE: break
+        before = page_cursor(page[0])
+    return [row for page in pages for row in page]
+
+def load_history_streamed(supabase: Client, user_id, is_premium):
+    # First page (recent 20) is shown right away, older pages stream in on the background executor.
+    # A history another session already loaded is shared from the process-wide cache instead.
+    st.session_state.history_backfill = None
+    first_page = history_cache_get(user_id, is_premium)
+    complete = first_page is not None
+    if complete:
+        # The shared copy may predate trades saved elsewhere since it was published -> top it up incrementally
+        newer = load_data_from_supabase(supabase, user_id, after_id=first_page.max_number("id") if first_page else None)
+        first_page = sort_by_entry_time(merge_trades(first_page, newer))
+    else:
+        try:
+            first_page = select_with_summary_columns(lambda columns: fetch_trades_page(supabase, user_id, limit=RECENT_LIMIT, columns=columns))
+            complete = len(first_page) < RECENT_LIMIT
+        except Exception as e:
+            st.error(f"Data Load Error: {e}")
+            first_page = []
+    # Saves not yet replicated (outage / restart) stay visible
+    pending = pending_local_trades(user_id)
+    st.session_state.local_pending = {row["client_id"] for row in pending}
+    set_session_history(merge_trades(first_page, pending) if pending else first_page, publish=complete and not pending)
+    if not complete and len(first_page) == RECENT_LIMIT:
+        columns = summary_columns() if is_premium else ARCHIVE_COLUMNS
+        st.session_state.history_backfill = get_background_executor().submit(
+            backfill_older_trades, supabase, user_id, page_cursor(first_page[0]), columns)
+
+def merge_history_backfill():
+    future = st.session_state.history_backfill
+    if future is None or not future.done(): return
+    st.session_state.history_backfill = None
+    try:
+        older = future.result()
     except Exception as e:
         st.error(f"Data Load Error: {e}")
-        return [], []
+        return
+    if older:
+        set_session_history([*older, *st.session_state.full_history], publish=not st.session_state.local_pending)
+
+def detail_columns():
+    return DETAIL_COLUMNS if st.session_state.ai_feedback_column else LEGACY_DETAIL_COLUMNS
+
+def fetch_trade_details(supabase: Client, trade_id):
+    # Like select_with_summary_columns: before sql/trades_ai_feedback.sql is applied, drop ai_feedback (42703)
+    def fetch():
+        return supabase.table("trades").select(", ".join(detail_columns())) \
+            .eq("id", trade_id).eq("user_id", st.session_state.user_id).execute().data
+    try:
+        return fetch()
+    except Exception as e:
+        if not is_undefined_column(e) or not st.session_state.ai_feedback_column: raise
+        st.session_state.ai_feedback_column = False
+        return fetch()
+
+def load_trade_details(supabase: Client, record):
+    # Lazy heavy fields (strategy_detail / review / memos) for a single selected trade
+    trade_id = record.get("id")
+    if isinstance(trade_id, float):
+        trade_id = int(trade_id) if trade_id == trade_id else None
+    details = {"strategy_detail": "", "review": "", "memos": [], "ai_feedback": ""}
+    columns = detail_columns()
+    present = {col: record[col] for col in columns if col in record and not isinstance(record[col], float)}
+    if trade_id is None or len(present) == len(columns):
+        # Full rows and local saves not replicated yet (no id to fetch by) already hold the fields
+        return {**details, **present}
+    if trade_id in st.session_state.trade_details:
+        return st.session_state.trade_details[trade_id]
+    if supabase and trade_id is not None:
+        try:
+            data = fetch_trade_details(supabase, trade_id)
+            if data:
+                details.update({col: data[0].get(col) or details[col] for col in DETAIL_COLUMNS})
+                if isinstance(details["memos"], str):
+                    try: details["memos"] = ast.literal_eval(details["memos"])
+                    except: details["memos"] = []
+                st.session_state.trade_details[trade_id] = details
+        except Exception as e:
+            st.error(f"Detail Load Error: {e}")
+    return details
+
+def merge_trades(existing, new_rows):
+    # Rows already known (overlapping fetches) are deduped by id;
+    # the replicated copy of a local save (same client_id) replaces the local row. Unchanged -> `existing` itself.
+    ids, client_ids = history_column(existing, "id"), history_column(existing, "client_id")
+    known_ids = {row_id for row_id in ids if row_id is not None}
+    known_client_ids = {client_id for client_id in client_ids if client_id}
+    local_rows = {client_id: i for i, (row_id, client_id) in enumerate(zip(ids, client_ids)) if client_id and row_id is None}
+    merged = list(existing)
+    changed = False
+    for row in new_rows:
+        row_id, client_id = row.get("id"), row.get("client_id")
+        if row_id is not None and row_id in known_ids: continue
+        known_ids.add(row_id)
+        changed = True
+        if client_id in local_rows and row_id is not None:
+            merged[local_rows.pop(client_id)] = row
+            continue
+        if client_id and client_id in known_client_ids: continue
+        known_client_ids.add(client_id)
+        merged.append(row)
+    return merged if changed else existing
+
+# Process-wide history cache: sessions (tabs) of the same user share one immutable TradeHistory of a fully
+# loaded history. LRU eviction by estimated size; any local write drops the entry (next login reloads).
+HISTORY_CACHE_MAX_BYTES = 512 * 1024 * 1024
+HISTORY_CACHE_MAX_ENTRIES = 256
+
+@st.cache_resource
+def get_history_cache():
+    return {"lock": threading.Lock(), "entries": OrderedDict(), "bytes": 0}
+
+def history_cache_get(user_id, is_premium):
+    cache = get_history_cache()
+    key = (user_id, bool(is_premium))
+    with cache["lock"]:
+        entry = cache["entries"].get(key)
+        if entry is None: return None
+        cache["entries"].move_to_end(key)
+        return entry["rows"]
+
+def history_cache_put(user_id, is_premium, rows):
+    # Returns the shared copy the session should hold from now on
+    rows = TradeHistory.from_rows(rows)
+    size = rows.nbytes
+    cache = get_history_cache()
+    key = (user_id, bool(is_premium))
+    with cache["lock"]:
+        old = cache["entries"].pop(key, None)
+        if old: cache["bytes"] -= old["bytes"]
+        if size <= HISTORY_CACHE_MAX_BYTES:
+            cache["entries"][key] = {"rows": rows, "bytes": size}
+            cache["bytes"] += size
+        while cache["entries"] and (cache["bytes"] > HISTORY_CACHE_MAX_BYTES or len(cache["entries"]) > HISTORY_CACHE_MAX_ENTRIES):
+            _, evicted = cache["entries"].popitem(last=False)
+            cache["bytes"] -= evicted["bytes"]
+    return rows
+
+def history_cache_invalidate(user_id, is_premium):
+    cache = get_history_cache()
+    with cache["lock"]:
+        old = cache["entries"].pop((user_id, bool(is_premium)), None)
+        if old: cache["bytes"] -= old["bytes"]
+
+def set_session_history(full_history, publish=False):
+    # publish: a complete server load, shared with other sessions. Anything else is a local change that
+    # invalidates the shared copy. Rows are read-only views -> replace rows, never mutate them in place.
+    full_history = TradeHistory.from_rows(full_history)
+    if publish and st.session_state.user_id:
+        full_history = history_cache_put(st.session_state.user_id, st.session_state.is_premium, full_history)
+    elif st.session_state.user_id:
+        history_cache_invalidate(st.session_state.user_id, st.session_state.is_premium)
+    st.session_state.full_history = full_history
+    st.session_state.history = full_history[-20:] if len(full_history) > 20 else full_history
+    st.session_state.last_trade_id = full_history.max_number("id") if full_history else None
+    st.session_state.history_version += 1 # Invalidates the cached analytics frame
+    st.session_state.trade_vocab = sync_trade_vocab(st.session_state.trade_vocab, full_history)
+
+def reload_history(supabase: Client, user_id):
+    # Full reload from the server: drops the shared cached copy and the lazily loaded details too
+    if st.session_state.history_backfill is not None:
+        st.session_state.history_backfill.cancel()
+    history_cache_invalidate(user_id, st.session_state.is_premium)
+    st.session_state.trade_details = {}
+    load_history_streamed(supabase, user_id, st.session_state.is_premium)
+
+def has_unmatched_local_rows(full_history):
+    # Local saves that already left the outbox but never got their server id mirrored (replicated by another
+    # process, id map expired): merge_trades can't pair them with their server copy
+    pending = st.session_state.local_pending
+    return any(row_id is None and client_id not in pending
+               for row_id, client_id in zip(history_column(full_history, "id"), history_column(full_history, "client_id")))
+
+def sort_by_entry_time(rows):
+    # Rows fetched by id can belong before already known ones (a trade opened earlier, closed later) -> stable
+    # re-sort into the entry_time order a full load returns; already ordered histories are returned as-is
+    times = pd.to_datetime(pd.Series(history_column(rows, "entry_time"), dtype=object), utc=True, format="ISO8601", errors="coerce")
+    if times.is_monotonic_increasing: return rows
+    return [rows[i] for i in np.argsort(times.to_numpy(), kind="stable")]
+
+def sync_history(supabase: Client, user_id):
+    # Incremental sync: fetch only trades inserted after the session high-water mark (server id)
+    if has_unmatched_local_rows(st.session_state.full_history):
+        reload_history(supabase, user_id) # Appending the server copies would duplicate those trades
+        return
+    new_rows = load_data_from_supabase(supabase, user_id, after_id=st.session_state.last_trade_id)
+    merged = merge_trades(st.session_state.full_history, new_rows)
+    if merged is not st.session_state.full_history: # Nothing new -> keep sharing the cached copy
+        set_session_history(sort_by_entry_time(merged))
 
 def save_trade_to_supabase(supabase: Client, trade_data, user_id):
+    # Written to the local store first (milliseconds, survives outages); the replicator pushes it to Supabase
     try:
         payload = {
+            "client_id": uuid.uuid4().hex,
             "user_id": str(user_id).strip(),
             "entry_time": trade_data.get("entry_time").isoformat() if isinstance(trade_data.get("entry_time"), datetime) else trade_data.get("entry_time"),
             "exit_time": trade_data.get("exit_time").isoformat() if isinstance(trade_data.get("exit_time"), datetime) else trade_data.get("exit_time"),
@@ -582,10 +1037,973 @@ def save_trade_to_supabase(supabase: Client, trade_data, user_id):
             "duration_minutes": trade_data.get("duration_minutes", 0.0),
             "memos": trade_data.get("memos", [])
         }
-        supabase.table("trades").insert(payload).execute()
+        enqueue_write("insert", "trades", payload, user_id=payload["user_id"], client_id=payload["client_id"])
+        wake_replicator(supabase)
+        # Return the local row so callers can append it right away; its server id arrives after replication
+        return dict(payload, id=None)
+    except Exception as e:
+        st.error(f"Local Save Error: {e}")
+        return None
+
+# --- Local Store & Replication ---
+# Trade writes (save / chart_url / ai_feedback) land in a local SQLite outbox first. A background thread replays
+# it to Supabase in order, in batches, with backoff. Trades carry a client_id (sql/trades_client_id.sql): replays
+# are idempotent and updates can target a trade before its server id is known. Account writes (register / UID)
+# stay synchronous: the UI has to know they succeeded, and credentials are never written to disk.
+LOCAL_STORE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "local_store.sqlite3")
+OUTBOX_BATCH_SIZE = 50
+OUTBOX_POLL_S = 5
+OUTBOX_MAX_BACKOFF_S = 300
+OUTBOX_ID_TTL_S = 7 * 24 * 3600
+# Postgres error classes (data exception / integrity violation / undefined column...) that a retry cannot fix
+OUTBOX_PERMANENT_ERROR_CLASSES = ("22", "23", "42")
+# HTTP 4xx are the client's fault too, except these two
+OUTBOX_TRANSIENT_HTTP_STATUSES = ("408", "429")
+
+def _local_store_connect():
+    os.makedirs(os.path.dirname(LOCAL_STORE_PATH), exist_ok=True)
+    conn = sqlite3.connect(LOCAL_STORE_PATH, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS outbox (seq INTEGER PRIMARY KEY AUTOINCREMENT, op TEXT NOT NULL, table_name TEXT NOT NULL, "
+                 "payload TEXT NOT NULL, match TEXT, user_id TEXT, client_id TEXT, status TEXT NOT NULL DEFAULT 'pending', "
+                 "attempts INTEGER NOT NULL DEFAULT 0, next_attempt REAL NOT NULL DEFAULT 0, last_error TEXT)")
+    conn.execute("CREATE TABLE IF NOT EXISTS replicated_ids (client_id TEXT PRIMARY KEY, trade_id INTEGER NOT NULL, synced_at REAL NOT NULL)")
+    return conn
+
+def enqueue_write(op, table_name, payload, match=None, user_id=None, client_id=None):
+    # Safe from worker threads (one connection per call); raises if the local store itself is unusable
+    with closing(_local_store_connect()) as conn, conn:
+        conn.execute("INSERT INTO outbox (op, table_name, payload, match, user_id, client_id) VALUES (?, ?, ?, ?, ?, ?)",
+                     (op, table_name, json.dumps(payload, default=str, ensure_ascii=False),
+                      json.dumps(match) if match else None, user_id, client_id))
+
+def trade_ref(row):
+    # Local saves are addressed by client_id until (and after) replication; older rows by id
+    return {"client_id": row["client_id"]} if row.get("client_id") else {"id": row.get("id")}
+
+def matches_trade_ref(row, ref):
+    return all(row.get(key) == value for key, value in ref.items())
+
+def pending_local_trades(user_id):
+    # Unreplicated trade inserts of this user (rejected ones included, until retried or discarded),
+    # with their queued updates (chart_url / ai_feedback) applied
+    try:
+        with closing(_local_store_connect()) as conn:
+            rows = conn.execute("SELECT op, payload, client_id FROM outbox WHERE table_name = 'trades' AND user_id = ? "
+                                "AND status IN ('pending', 'failed') ORDER BY seq", (user_id,)).fetchall()
+    except sqlite3.Error:
+        return []
+    trades = {}
+    for op, payload, client_id in rows:
+        if op == "insert":
+            trades[client_id] = normalize_trade_row(dict(json.loads(payload), id=None))
+        elif client_id in trades:
+            trades[client_id].update(json.loads(payload))
+    return list(trades.values())
+
+def failed_local_writes(user_id):
+    # Writes the server rejected for good (constraint / permission / schema); kept until retried or discarded
+    try:
+        with closing(_local_store_connect()) as conn:
+            rows = conn.execute("SELECT seq, op, payload, match, client_id, last_error FROM outbox "
+                                "WHERE user_id = ? AND status = 'failed' ORDER BY seq", (user_id,)).fetchall()
+    except sqlite3.Error:
+        return []
+    return [{"seq": seq, "op": op, "payload": json.loads(payload), "match": json.loads(match) if match else None,
+             "client_id": client_id, "error": error} for seq, op, payload, match, client_id, error in rows]
+
+def outbox_retry_error(user_id):
+    # Last error of this user's oldest write that is being retried (server down / timeouts), None if none is
+    try:
+        with closing(_local_store_connect()) as conn:
+            row = conn.execute("SELECT last_error FROM outbox WHERE user_id = ? AND status = 'pending' AND attempts > 0 "
+                               "ORDER BY seq LIMIT 1", (user_id,)).fetchone()
+    except sqlite3.Error:
+        return None
+    return row[0] if row else None
+
+def retry_failed_writes(user_id):
+    with closing(_local_store_connect()) as conn, conn:
+        conn.execute("UPDATE outbox SET status = 'pending', attempts = 0, next_attempt = 0 WHERE user_id = ? AND status = 'failed'",
+                     (user_id,))
+
+def discard_failed_write(user_id, write):
+    # A discarded trade insert takes its queued updates (chart_url / ai_feedback) with it
+    with closing(_local_store_connect()) as conn, conn:
+        if write["op"] == "insert" and write["client_id"]:
+            conn.execute("DELETE FROM outbox WHERE user_id = ? AND client_id = ?", (user_id, write["client_id"]))
+        else:
+            conn.execute("DELETE FROM outbox WHERE seq = ?", (write["seq"],))
+
+def replicated_trade_ids(client_ids):
+    try:
+        with closing(_local_store_connect()) as conn:
+            marks = ",".join("?" * len(client_ids))
+            return dict(conn.execute(f"SELECT client_id, trade_id FROM replicated_ids WHERE client_id IN ({marks})",
+                                     list(client_ids)).fetchall())
+    except sqlite3.Error:
+        return {}
+
+def apply_replicated_ids():
+    # Mirror server ids of replicated local saves into the session history (lazy details / batch review need them)
+    if not st.session_state.local_pending: return
+    ids = replicated_trade_ids(st.session_state.local_pending)
+    if not ids: return
+    history = [dict(row, id=ids[row["client_id"]]) if row.get("id") is None and row.get("client_id") in ids else row
+               for row in st.session_state.full_history]
+    if st.session_state.trade_data.get("client_id") in ids:
+        st.session_state.trade_data["id"] = ids[st.session_state.trade_data["client_id"]]
+    st.session_state.local_pending -= set(ids)
+    set_session_history(history)
+
+def failed_write_label(write):
+    payload = write["payload"]
+    if write["op"] == "insert":
+        return f"Trade {payload.get('ticker', 'Unknown')} · {str(payload.get('entry_time') or '')[:16].replace('T', ' ')}"
+    target = write["client_id"] or ", ".join(f"{key}={value}" for key, value in (write["match"] or {}).items())
+    return f"Update of {', '.join(payload)} ({target})"
+
+def render_failed_writes(supabase: Client):
+    # Persistent notice for writes the server rejected; nothing the user saved is dropped silently
+    failed = failed_local_writes(st.session_state.user_id)
+    st.session_state.local_failed = {write["client_id"] for write in failed if write["op"] == "insert" and write["client_id"]}
+    if not failed: return
+    st.error(f"⚠️ {len(failed)} saved change(s) were rejected by the server and are kept on this device only. "
+             "Retry once the cause is fixed, or discard them.")
+    with st.expander("Unsynced changes"):
+        for write in failed:
+            c_info, c_discard = st.columns([5, 1])
+            c_info.caption(f"**{failed_write_label(write)}** — {write['error']}")
+            if c_discard.button("Discard", key=f"discard_write_{write['seq']}"):
+                discard_failed_write(st.session_state.user_id, write)
+                if write["op"] == "insert" and write["client_id"]:
+                    st.session_state.local_pending.discard(write["client_id"])
+                    set_session_history([row for row in st.session_state.full_history if row.get("client_id") != write["client_id"]])
+                st.rerun()
+        if st.button("🔁 Retry Sync"):
+            retry_failed_writes(st.session_state.user_id)
+            wake_replicator(supabase)
+            st.rerun()
+
+def is_permanent_write_error(e):
+    # SQLSTATE classes above, PostgREST request / schema / auth errors (PGRST1xx-3xx, e.g. PGRST204 unknown column)
+    # and bare 4xx responses; PGRST0xx (connection / pool), 5xx and network errors are retried with backoff
+    code = str(getattr(e, "code", "") or "")
+    if code.startswith("PGRST"):
+        return not code.startswith("PGRST0")
+    status = str(getattr(getattr(e, "response", None), "status_code", "") or (code if len(code) == 3 and code.isdigit() else ""))
+    if status:
+        return status.startswith("4") and status not in OUTBOX_TRANSIENT_HTTP_STATUSES
+    return code[:2] in OUTBOX_PERMANENT_ERROR_CLASSES
+
+def _replicate_inserts(supabase: Client, table_name, payloads):
+    if table_name != "trades":
+        supabase.table(table_name).insert(payloads).execute()
+        return {}
+    # upsert on client_id: a batch that reached the server before a timeout is not inserted twice
+    res = supabase.table("trades").upsert(payloads, on_conflict="client_id", ignore_duplicates=True).execute()
+    ids = {row["client_id"]: row["id"] for row in res.data or [] if row.get("client_id")}
+    missing = [p["client_id"] for p in payloads if p["client_id"] not in ids]
+    if missing:
+        res = supabase.table("trades").select("id, client_id").in_("client_id", missing).execute()
+        ids.update({row["client_id"]: row["id"] for row in res.data or []})
+    return ids
+
+def _replicate_update(supabase: Client, table_name, payload, match):
+    query = supabase.table(table_name).update(payload)
+    for key, value in match.items():
+        query = query.eq(key, value)
+    query.execute()
+
+def replicate_outbox(supabase: Client):
+    # Drains the outbox in seq order per user: a write that is backing off holds back the later writes of
+    # its user only. Runs on the replicator thread -> no st.* calls in here
+    batch_size = OUTBOX_BATCH_SIZE
+    while True:
+        with closing(_local_store_connect()) as conn:
+            rows = conn.execute("SELECT seq, op, table_name, payload, match, attempts, next_attempt, client_id FROM outbox AS o "
+                                "WHERE status = 'pending' AND NOT EXISTS (SELECT 1 FROM outbox AS b WHERE b.status = 'pending' "
+                                "AND b.user_id IS o.user_id AND b.seq <= o.seq AND b.next_attempt > ?) ORDER BY seq LIMIT ?",
+                                (time.time(), batch_size)).fetchall()
+        if not rows: return # Empty, or every user with queued writes is backing off
+        seq, op, table_name = rows[0][:3]
+        batch = [rows[0]]
+        if op == "insert": # Leading run of inserts into one table goes out as a single request
+            for row in rows[1:]:
+                if row[1] != "insert" or row[2] != table_name: break
+                batch.append(row)
+        seqs = [row[0] for row in batch]
+        marks = ",".join("?" * len(seqs))
+        try:
+            ids = {}
+            if op == "insert":
+                ids = _replicate_inserts(supabase, table_name, [json.loads(row[3]) for row in batch])
+            else:
+                _replicate_update(supabase, table_name, json.loads(batch[0][3]), json.loads(batch[0][4]))
+        except Exception as e:
+            permanent = is_permanent_write_error(e)
+            if permanent and len(batch) > 1:
+                batch_size = 1 # Find the rejected row(s) one by one instead of parking the whole batch
+                continue
+            attempts = batch[0][5] + 1
+            client_ids = [row[7] for row in batch if row[7]]
+            with closing(_local_store_connect()) as conn, conn:
+                conn.execute(f"UPDATE outbox SET status = ?, attempts = ?, next_attempt = ?, last_error = ? WHERE seq IN ({marks})",
+                             ["failed" if permanent else "pending", attempts,
+                              time.time() + min(2 ** attempts, OUTBOX_MAX_BACKOFF_S), str(e)[:500], *seqs])
+                if permanent and op == "insert" and client_ids:
+                    # Queued updates of a rejected trade would match no row -> park them with it (retried together)
+                    conn.execute(f"UPDATE outbox SET status = 'failed', last_error = ? WHERE status = 'pending' "
+                                 f"AND client_id IN ({','.join('?' * len(client_ids))})", [str(e)[:500], *client_ids])
+            continue # Permanent: shown to the user (retry / discard). Transient: its user waits out the backoff
+        now = time.time()
+        with closing(_local_store_connect()) as conn, conn:
+            conn.execute(f"DELETE FROM outbox WHERE seq IN ({marks})", seqs)
+            conn.executemany("INSERT OR REPLACE INTO replicated_ids VALUES (?, ?, ?)",
+                             [(client_id, trade_id, now) for client_id, trade_id in ids.items()])
+            conn.execute("DELETE FROM replicated_ids WHERE synced_at < ?", (now - OUTBOX_ID_TTL_S,))
+
+@st.cache_resource
+def get_outbox_replicator(_supabase: Client):
+    # One replicator thread per server process; the returned event wakes it early after a local write
+    wake = threading.Event()
+    def run():
+        while True:
+            try:
+                replicate_outbox(_supabase)
+            except Exception:
+                pass # Local store busy/unavailable -> retry on the next tick
+            wake.wait(OUTBOX_POLL_S)
+            wake.clear()
+    threading.Thread(target=run, name="trading-journal-replicator", daemon=True).start()
+    return wake
+
+def wake_replicator(supabase: Client):
+    if supabase: get_outbox_replicator(supabase).set()
+
+# --- Ticker / Strategy Vocabularies ---
+# PRE_TRADING selectbox options, kept in step with full_history by set_session_history: an append only scans
+# the new rows, anything else (older pages backfilled, logout) rebuilds from the history columns.
+VOCAB_COLUMNS = ("ticker", "strategy_name")
+VOCAB_RECENT = 5 # Most recently traded values lead the options, the rest follow by frequency
+VOCAB_SEARCH_LIMIT = 8
+
+def vocab_tail(row):
+    return tuple(row.get(col) for col in ("entry_time", *VOCAB_COLUMNS))
+
+def sync_trade_vocab(vocab, full_history):
+    # values[col][value] = [count, last row position]; sorted[col] = (casefolded, value) pairs for prefix search
+    covered = vocab["rows"] if vocab else 0
+    extends = vocab is not None and len(full_history) >= covered and (covered == 0 or vocab_tail(full_history[covered - 1]) == vocab["tail"])
+    if not extends:
+        vocab, covered = {"rows": 0, "values": {col: {} for col in VOCAB_COLUMNS}, "sorted": {col: [] for col in VOCAB_COLUMNS}}, 0
+    elif len(full_history) == covered:
+        return vocab # Same rows (chart / id patches) -> nothing to rescan
+    new_rows = full_history[covered:]
+    for col in VOCAB_COLUMNS:
+        stats, index = vocab["values"][col], vocab["sorted"][col]
+        for pos, value in enumerate(history_column(new_rows, col), covered):
+            if value is None: continue
+            value = str(value)
+            entry = stats.get(value)
+            if entry is None:
+                stats[value] = [1, pos]
+                bisect.insort(index, (value.casefold(), value))
+            else:
+                entry[0] += 1
+                entry[1] = pos
+    vocab.update(rows=len(full_history), tail=vocab_tail(full_history[-1]) if len(full_history) else None, ordered={})
+    return vocab
+
+def vocab_options(vocab, col):
+    # Recently traded first, then by frequency (ties alphabetical); cached until the next sync
+    if not vocab: return []
+    if col not in vocab["ordered"]:
+        stats = vocab["values"][col]
+        by_recency = sorted(stats, key=lambda value: stats[value][1], reverse=True)
+        rest = sorted(by_recency[VOCAB_RECENT:], key=lambda value: (-stats[value][0], value.casefold()))
+        vocab["ordered"][col] = by_recency[:VOCAB_RECENT] + rest
+    return vocab["ordered"][col]
+
+def vocab_prefix_search(vocab, col, prefix, limit=VOCAB_SEARCH_LIMIT):
+    # Case-insensitive prefix match: bisect into the sorted index, then rank the hits like vocab_options
+    if not vocab: return []
+    prefix = str(prefix).strip().casefold()
+    if not prefix: return vocab_options(vocab, col)[:limit]
+    index = vocab["sorted"][col]
+    matches = []
+    for key, value in islice(index, bisect.bisect_left(index, (prefix,)), None):
+        if not key.startswith(prefix): break
+        matches.append(value)
+    stats = vocab["values"][col]
+    matches.sort(key=lambda value: (-stats[value][1], -stats[value][0]))
+    return matches[:limit]
+
+def vocab_canonical(vocab, col, value):
+    # Existing spelling of a case-insensitive duplicate ("trend breakout" -> "Trend Breakout"), else value itself
+    key = str(value).strip().casefold()
+    return next((hit for hit in vocab_prefix_search(vocab, col, key, limit=None) if hit.casefold() == key), value)
+
+# --- Analytics Helpers ---
+
+PERIOD_DAYS = {"Last 7 Days": 7, "Last 30 Days": 30}
+MONEY_COLUMNS = ["start_balance", "final_balance", "profit", "roi", "duration_minutes"]
+
+def build_analytics_frame(full_history, is_premium):
+    # Typed once per history version: categoricals for labels, float64 for money, datetime64 for times
+    df = history_frame(full_history)
+    for col, default in (("strategy_name", "General"), ("ticker", "Unknown"), ("result_status", ""), ("mood", "")):
+        if col not in df.columns: df[col] = default
+        df[col] = df[col].fillna(default).astype(str).astype("category")
+    for col in MONEY_COLUMNS:
+        df[col] = pd.to_numeric(df[col], errors="coerce").astype("float64") if col in df.columns else 0.0
+    if 'datetime_obj' not in df.columns: # DuckDB frames arrive with the timestamp / label already computed
+        df['datetime_obj'] = pd.to_datetime(df['entry_time'], utc=True, format="ISO8601")
+    if 'date_str' not in df.columns:
+        df['date_str'] = df['datetime_obj'].dt.strftime('%m/%d')
+    
+    total_count = len(df)
+    df['is_locked'] = False
+    if (not is_premium) and (total_count > RECENT_LIMIT):
+        df.loc[:total_count-RECENT_LIMIT-1, 'is_locked'] = True
+    return df
+
+ARCHIVED_PLACEHOLDERS = {
+    "ticker": "🔒 Archived",
+    "strategy_name": "****",
+    "result_status": "Archived",
+    "profit": 0.0,
+    "roi": 0.0,
+    "mood": "🔒",
+    "chart_url": "",
+}
+
+def redact_archived_rows(df):
+    # One masked assignment per column instead of per-row .loc writes
+    redacted = df.copy()
+    locked = redacted['is_locked'].to_numpy(dtype=bool)
+    if not locked.any(): return redacted
+    for col, value in ARCHIVED_PLACEHOLDERS.items():
+        if col not in redacted.columns: redacted[col] = value
+        if isinstance(redacted[col].dtype, pd.CategoricalDtype) and value not in redacted[col].cat.categories:
+            redacted[col] = redacted[col].cat.add_categories([value])
+        redacted.loc[locked, col] = value
+    return redacted
+
+# Equity curve x-axis modes -> chart_df column; numeric/datetime axes avoid thousands of category ticks
+EQUITY_X_AXIS = {"Trade Label": "trade_label", "Trade #": "trade_num", "Date": "datetime_obj"}
+EQUITY_LABEL_AXIS_MAX = 200
+# Adaptive equity rendering: min-max downsample to the point budget, WebGL/no markers on large curves
+EQUITY_POINT_BUDGET = 2000
+EQUITY_WEBGL_THRESHOLD = 1000
+EQUITY_MARKER_MAX = 300
+
+def downsample_equity(chart_df, budget=EQUITY_POINT_BUDGET, keep_tail=RECENT_LIMIT):
+    # Min-max per bucket keeps peaks/troughs (drawdowns stay visible); last keep_tail trades stay untouched
+    n_head = len(chart_df) - keep_tail
+    if len(chart_df) <= budget or n_head <= 0: return chart_df
+    n_buckets = max(1, budget // 2)
+    balance = chart_df['final_balance'].iloc[:n_head].reset_index(drop=True)
+    bucket_ids = np.arange(n_head) * n_buckets // n_head
+    grouped = balance.groupby(bucket_ids)
+    keep = np.union1d(grouped.idxmin().dropna().to_numpy(), grouped.idxmax().dropna().to_numpy()).astype(int)
+    keep = np.union1d(np.union1d(keep, [0]), np.arange(n_head, len(chart_df)))
+    return chart_df.iloc[keep]
+
+def build_equity_figure(chart_df, x_col):
+    plot_df = downsample_equity(chart_df)
+    n_points = len(plot_df)
+    hover_text = plot_df['date_str'] if x_col != "trade_label" else None
+    if n_points > EQUITY_WEBGL_THRESHOLD:
+        fig = go.Figure(go.Scattergl(x=plot_df[x_col], y=plot_df['final_balance'], mode='lines', fill='tozeroy',
+                                     hovertext=hover_text, line=dict(color='#AB63FA'), fillcolor='rgba(171, 99, 250, 0.2)'))
+    else:
+        fig = px.area(plot_df, x=x_col, y='final_balance', markers=n_points <= EQUITY_MARKER_MAX,
+                      hover_data=None if hover_text is None else ['date_str'])
+        fig.update_traces(line_color='#AB63FA', line_shape='spline', fillcolor='rgba(171, 99, 250, 0.2)')
+    return fig
+
+# Time Edge bucket edges in minutes (right-inclusive); the last bucket is open-ended
+DURATION_BIN_EDGES = [60, 180, 360, 720, 1440]
+
+def duration_bin_labels(edges=DURATION_BIN_EDGES):
+    bounds = [0] + list(edges)
+    labels = [f"{lo / 60:g}-{hi / 60:g}h" for lo, hi in zip(bounds[:-1], bounds[1:])]
+    return labels + [f"{bounds[-1] / 60:g}h+"]
+
+def time_edge_stats(df, edges=DURATION_BIN_EDGES):
+    # One pd.cut pass + one grouped mean, regardless of the number of buckets
+    labels = duration_bin_labels(edges)
+    bins = pd.cut(df['duration_minutes'], bins=[-np.inf, *edges, np.inf], labels=labels)
+    win_rate = (df['profit'] > 0).groupby(bins, observed=False).mean() * 100
+    return pd.DataFrame({'Duration': labels, 'Win Rate': win_rate.reindex(labels).fillna(0.0).to_numpy()})
+
+# Psychology Edge: one grouped pass over mood x strategy x ticker, cheap roll-ups for each view
+GROUP_STAT_KEYS = ["mood", "strategy_name", "ticker"]
+MOOD_HEATMAP_DIMENSIONS = {"Strategy": "strategy_name", "Ticker": "ticker"}
+MOOD_HEATMAP_METRICS = {"Win Rate (%)": "win_rate", "Expectancy ($)": "expectancy", "Avg Duration (m)": "avg_duration",
+                        "Drawdown Contribution (%)": "drawdown_contribution", "Trades": "trades"}
+MOOD_HEATMAP_MAX_COLUMNS = 15
+
+def max_drawdown_window(profit):
+    # Trade positions [start, end) from the equity peak to the trough of the deepest drawdown ((0, 0) if none);
+    # same curve as compute_risk_metrics: cumulative profit over the chronological frame
+    equity = np.concatenate(([0.0], np.cumsum(profit)))
+    peak = np.maximum.accumulate(equity)
+    trough = int(np.argmax(peak - equity))
+    if peak[trough] <= equity[trough]: return 0, 0
+    return int(np.argmax(equity[:trough + 1])), trough # equity[k] is after trade k-1
+
+def trade_group_sums(df, keys=GROUP_STAT_KEYS):
+    # Additive sums only, so any coarser grouping can be rolled up from this table without touching df again.
+    # drawdown_pnl: profit of the trades inside the max drawdown window (they add up to -max drawdown)
+    profit = df['profit']
+    start, end = max_drawdown_window(np.nan_to_num(profit.to_numpy(dtype=float)))
+    in_drawdown = np.zeros(len(df), dtype=bool)
+    in_drawdown[start:end] = True
+    parts = df[keys].assign(trades=1, wins=(profit > 0).astype("int64"), profit=profit, drawdown_pnl=profit.where(in_drawdown, 0.0),
+                            duration=df['duration_minutes'], duration_n=df['duration_minutes'].notna().astype("int64"))
+    return parts.groupby(keys, observed=True, sort=False).sum().reset_index()
+
+def rollup_group_stats(sums, by, total_drawdown=None):
+    # total_drawdown: drawdown_contribution denominator when `sums` is only part of the filtered trades.
+    # A group's contribution is its share of the max drawdown; winners inside the window count negative
+    grouped = sums.groupby(by, observed=True)[['trades', 'wins', 'profit', 'drawdown_pnl', 'duration', 'duration_n']].sum()
+    grouped = grouped[grouped['trades'] > 0]
+    if total_drawdown is None: total_drawdown = sums['drawdown_pnl'].sum()
+    return pd.DataFrame({
+        'trades': grouped['trades'],
+        'win_rate': grouped['wins'] / grouped['trades'] * 100,
+        'expectancy': grouped['profit'] / grouped['trades'],
+        'avg_duration': grouped['duration'] / grouped['duration_n'].where(grouped['duration_n'] > 0),
+        'drawdown_contribution': grouped['drawdown_pnl'] / total_drawdown * 100 if total_drawdown < 0 else 0.0,
+    })
+
+def mood_heatmap_frame(sums, column, metric, max_columns=MOOD_HEATMAP_MAX_COLUMNS):
+    # Mood rows x most-traded column values; other values are left out of the grid
+    top = sums.groupby(column, observed=True)['trades'].sum().nlargest(max_columns).index
+    # Drawdown contribution stays relative to the whole drawdown, not just the columns that made the grid
+    stats = rollup_group_stats(sums[sums[column].isin(top)], ['mood', column], total_drawdown=sums['drawdown_pnl'].sum())
+    return stats[metric].unstack(column).reindex(columns=[c for c in top if c in stats.index.get_level_values(column)])
+
+HISTORY_TABLE_PAGE_SIZE = 100
+RESULT_STATUS_STYLES = {
+    'Win': f'color: {COLOR_WIN}; font-weight: bold;', '익절': f'color: {COLOR_WIN}; font-weight: bold;',
+    'Loss': f'color: {COLOR_LOSS}; font-weight: bold;', '손절': f'color: {COLOR_LOSS}; font-weight: bold;',
+    'Break-even': f'color: {COLOR_BE}; font-weight: bold;', '본절': f'color: {COLOR_BE}; font-weight: bold;',
+    'Locked': 'color: #888; font-style: italic;',
+}
+
+def history_table_styles(display_df):
+    # Whole-frame CSS computed in one vectorized pass (Styler.apply(axis=None)) instead of per-cell callbacks
+    styles = pd.DataFrame('', index=display_df.index, columns=display_df.columns)
+    for col in ['Profit($)', 'ROI(%)']:
+        values = pd.to_numeric(display_df[col], errors='coerce').to_numpy(dtype=float)
+        styles[col] = np.select([values > 0, values < 0], [f'color: {COLOR_WIN}', f'color: {COLOR_LOSS}'], 'color: #888')
+    styles['Result'] = display_df['Result'].astype(object).map(RESULT_STATUS_STYLES).fillna('color: black;').to_numpy()
+    return styles
+
+def get_analytics_frame():
+    # Cached per user + history version; filters only apply masks on top of it (treat as read-only)
+    key = (st.session_state.user_id, st.session_state.history_version, st.session_state.is_premium)
+    cached = st.session_state.analytics_frame
+    if cached is None or cached["key"] != key:
+        cached = {"key": key, "frame": build_analytics_frame(st.session_state.full_history, st.session_state.is_premium)}
+        st.session_state.analytics_frame = cached
+    return cached["frame"]
+
+def get_history_table_frame():
+    # Newest-first, archived rows redacted once per history version
+    df = get_analytics_frame()
+    cached = st.session_state.analytics_frame
+    if "table" not in cached:
+        cached["table"] = redact_archived_rows(df.sort_values('datetime_obj', ascending=False).reset_index(drop=True))
+    return cached["table"]
+
+def compute_kpis(df):
+    # Pandas fallback for the trade_kpis RPC (sql/trade_kpis.sql); masked sums instead of filtered copies
+    profit = df['profit'].to_numpy(dtype=float)
+    is_win, is_loss = profit > 0, profit < 0
+    n_wins, n_losses = int(is_win.sum()), int(is_loss.sum())
+    trade_count = len(df)
+    avg_win = profit[is_win].sum() / n_wins if n_wins else 0
+    avg_loss = abs(profit[is_loss].sum()) / n_losses if n_losses else 0
+    return {
+        "trade_count": trade_count,
+        "total_profit": np.nansum(profit),
+        "win_rate": (n_wins / trade_count * 100) if trade_count > 0 else 0,
+        "avg_win": avg_win,
+        "avg_loss": avg_loss,
+        "pl_ratio": avg_win / avg_loss if avg_loss > 0 else 0,
+        "avg_holding": df['duration_minutes'].mean() if 'duration_minutes' in df.columns and trade_count > 0 else 0,
+    }
+
+@st.cache_data(ttl=60, show_spinner=False)
+def fetch_kpis_from_supabase(_supabase: Client, user_id, strategies, tickers, days, recent_limit, history_key):
+    # history_key (last synced entry_time + row count) invalidates the cache after saves/resyncs
+    res = _supabase.rpc("trade_kpis", {
+        "p_user_id": user_id,
+        "p_strategies": list(strategies) if strategies else None,
+        "p_tickers": list(tickers) if tickers else None,
+        "p_days": days,
+        "p_recent_limit": recent_limit,
+    }).execute()
+    row = res.data[0] if isinstance(res.data, list) else res.data
+    return kpis_from_aggregates(row)
+
+def kpis_from_aggregates(row):
+    # Same KPI dict as compute_kpis, from SQL aggregates (trade_kpis RPC / DuckDB)
+    trade_count = row.get("trade_count") or 0
+    avg_win = row.get("avg_win") or 0
+    avg_loss = row.get("avg_loss") or 0
+    return {
+        "trade_count": trade_count,
+        "total_profit": row.get("total_profit") or 0,
+        "win_rate": ((row.get("win_count") or 0) / trade_count * 100) if trade_count > 0 else 0,
+        "avg_win": avg_win,
+        "avg_loss": avg_loss,
+        "pl_ratio": avg_win / avg_loss if avg_loss > 0 else 0,
+        "avg_holding": row.get("avg_holding") or 0,
+    }
+
+# --- Columnar Analytics Backend (optional: pip install duckdb) ---
+# Large premium histories: cold rows live in per-user append-only Parquet segments (compacted when they pile up),
+# the hot tail (recent trades, where saves and chart/id patches land) stays in memory. ANALYTICS filters and
+# aggregates run as DuckDB queries, so no full pandas frame is kept per session.
+COLUMNAR_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "columnar")
+COLUMNAR_MIN_ROWS = 20000
+COLUMNAR_MAX_SEGMENTS = 16
+COLUMNAR_TEXT_COLUMNS = ["client_id", "entry_time", "exit_time", "ticker", "strategy_name", "mood", "result_status", "chart_url"]
+COLUMNAR_COLUMNS = ["id", *COLUMNAR_TEXT_COLUMNS, *MONEY_COLUMNS]
+COLUMNAR_RETIRE_S = 600
+COLUMNAR_FRAME_CACHE_SIZE = 4 # Filtered frames kept per session and history version (recent filter combinations)
+
+@st.cache_resource
+def get_columnar_lock():
+    # Tabs of one user share the Parquet directory; segment / manifest rewrites are serialized
+    return threading.Lock()
+
+def columnar_user_dir(user_id):
+    return os.path.join(COLUMNAR_DIR, hashlib.sha256(str(user_id).encode("utf-8")).hexdigest()[:16])
+
+def read_columnar_manifest(user_dir):
+    try:
+        with open(os.path.join(user_dir, "manifest.json")) as f: return json.load(f)
+    except (OSError, ValueError):
+        return {"rows": 0, "head": None, "tail": None, "segments": [], "next": 0}
+
+def columnar_enabled(full_history, is_premium):
+    return duckdb is not None and is_premium and len(full_history) >= COLUMNAR_MIN_ROWS
+
+def columnar_rows_frame(rows):
+    # Fixed schema for every segment and the hot tail, so they UNION cleanly
+    df = history_frame(rows).reindex(columns=COLUMNAR_COLUMNS)
+    df["id"] = pd.to_numeric(df["id"], errors="coerce").astype("float64")
+    for col in COLUMNAR_TEXT_COLUMNS:
+        df[col] = df[col].astype(object).where(df[col].notna(), None).astype("string")
+    for col in MONEY_COLUMNS:
+        df[col] = pd.to_numeric(df[col], errors="coerce").astype("float64")
+    df["entry_ts"] = pd.to_datetime(df["entry_time"], utc=True, format="ISO8601")
+    return df
+
+def copy_to_parquet(con, query, path):
+    # Written under a temporary name and renamed, so readers never see a half-written segment
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    con.execute(f"COPY ({query}) TO '{tmp_path}' (FORMAT PARQUET)")
+    os.replace(tmp_path, path)
+
+def write_parquet_segment(con, rows, path):
+    con.register("segment_rows", columnar_rows_frame(rows))
+    try:
+        copy_to_parquet(con, "SELECT * FROM segment_rows", path)
+    finally:
+        con.unregister("segment_rows")
+
+def sync_columnar_store(con, user_id, full_history):
+    with get_columnar_lock():
+        return _sync_columnar_store(con, user_id, full_history)
+
+def _sync_columnar_store(con, user_id, full_history):
+    # Append-only while the cold prefix is unchanged; prepended backfill pages etc. trigger a rewrite
+    user_dir = columnar_user_dir(user_id)
+    os.makedirs(user_dir, exist_ok=True)
+    manifest_path = os.path.join(user_dir, "manifest.json")
+    manifest = read_columnar_manifest(user_dir)
+    cold = full_history[:-RECENT_LIMIT]
+    n = manifest["rows"]
+    is_prefix = n <= len(cold) and (n == 0 or (cold[0].get("entry_time") == manifest["head"] and cold[n - 1].get("entry_time") == manifest["tail"]))
+    # Replaced segments are deleted only after a grace period: other tabs' views may still be reading them
+    now = time.time()
+    retired = []
+    for name, at in manifest.get("retired", []):
+        if at > now - COLUMNAR_RETIRE_S:
+            retired.append((name, at))
+            continue
+        try: os.remove(os.path.join(user_dir, name))
+        except OSError: pass
+    if not is_prefix:
+        retired += [(name, now) for name in manifest["segments"]]
+        manifest.update(rows=0, segments=[])
+    if len(cold) > manifest["rows"]:
+        name = f"seg-{manifest['next']:06d}.parquet"
+        write_parquet_segment(con, cold[manifest["rows"]:], os.path.join(user_dir, name))
+        manifest["segments"].append(name)
+        manifest["next"] += 1
+    if len(manifest["segments"]) > COLUMNAR_MAX_SEGMENTS:
+        name = f"seg-{manifest['next']:06d}.parquet"
+        paths = [os.path.join(user_dir, seg) for seg in manifest["segments"]]
+        copy_to_parquet(con, f"SELECT * FROM read_parquet({paths!r}) ORDER BY entry_ts", os.path.join(user_dir, name))
+        retired += [(seg, now) for seg in manifest["segments"]]
+        manifest.update(segments=[name], next=manifest["next"] + 1)
+    manifest.update(retired=retired, rows=len(cold), head=cold[0].get("entry_time") if cold else None, tail=cold[-1].get("entry_time") if cold else None)
+    tmp_path = f"{manifest_path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w") as f: json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)
+    return [os.path.join(user_dir, name) for name in manifest["segments"]]
+
+def get_columnar_connection():
+    # One DuckDB connection per session; the `trades` view is rebuilt per history version, and when another
+    # tab of the same user rewrote the store and the segments this view reads are gone
+    key = (st.session_state.user_id, st.session_state.history_version)
+    cached = st.session_state.columnar_store
+    if cached is not None and cached["key"] == key and not all(os.path.exists(path) for path in cached["segments"]):
+        cached = dict(cached, key=None)
+    if cached is None or cached["key"] != key:
+        if cached is None:
+            con = duckdb.connect()
+            con.execute("SET TimeZone = 'UTC'") # date_str is the UTC date, as in build_analytics_frame
+        else:
+            con = cached["con"]
+        full_history = st.session_state.full_history
+        segments = sync_columnar_store(con, st.session_state.user_id, full_history)
+        try: con.unregister("hot_trades")
+        except Exception: pass
+        con.register("hot_trades", columnar_rows_frame(full_history[-RECENT_LIMIT:]))
+        sources = [f"SELECT * FROM read_parquet({segments!r})"] if segments else []
+        con.execute("CREATE OR REPLACE VIEW trades AS " + " UNION ALL BY NAME ".join(sources + ["SELECT * FROM hot_trades"]))
+        cached = {"key": key, "con": con, "segments": segments, "frames": OrderedDict()}
+        st.session_state.columnar_store = cached
+    return cached["con"]
+
+def columnar_where(strategies, tickers, period):
+    clauses, params = [], []
+    for col, values in (("strategy_name", strategies), ("ticker", tickers)):
+        if values:
+            clauses.append(f"{col} IN ({', '.join('?' * len(values))})")
+            params += list(values)
+    if period in PERIOD_DAYS:
+        clauses.append("entry_ts >= ?")
+        params.append(datetime.now(timezone.utc) - timedelta(days=PERIOD_DAYS[period]))
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+def columnar_distinct(con, col):
+    return sorted(str(row[0]) for row in con.execute(f"SELECT DISTINCT {col} FROM trades").fetchall())
+
+def columnar_filtered_frame(con, strategies, tickers, period):
+    # Filter pushed down to Parquet; only matching rows are typed into the analytics frame shape.
+    # Cached per filter combination until the history version changes (treat as read-only).
+    frames = st.session_state.columnar_store["frames"]
+    key = (tuple(sorted(strategies)), tuple(sorted(tickers)), period,
+           datetime.now(timezone.utc).strftime("%Y%m%d%H") if period in PERIOD_DAYS else None) # Rolling windows age hourly
+    if key in frames:
+        frames.move_to_end(key)
+        return frames[key]
+    where, params = columnar_where(strategies, tickers, period)
+    result = con.execute(f"SELECT * EXCLUDE (entry_ts), entry_ts AS datetime_obj, strftime(entry_ts, '%m/%d') AS date_str "
+                         f"FROM trades{where} ORDER BY entry_ts", params)
+    # Via Arrow: about 3x cheaper than .df() for the string columns
+    table = result.to_arrow_table() if hasattr(result, "to_arrow_table") else result.fetch_arrow_table()
+    frames[key] = build_analytics_frame(table.to_pandas(), True)
+    while len(frames) > COLUMNAR_FRAME_CACHE_SIZE:
+        frames.popitem(last=False)
+    return frames[key]
+
+def columnar_kpis(con, strategies, tickers, period):
+    where, params = columnar_where(strategies, tickers, period)
+    row = con.execute(f"""
+        SELECT count(*) AS trade_count, sum(profit) AS total_profit, count(*) FILTER (WHERE profit > 0) AS win_count,
+               avg(profit) FILTER (WHERE profit > 0) AS avg_win, abs(avg(profit) FILTER (WHERE profit < 0)) AS avg_loss,
+               avg(duration_minutes) AS avg_holding
+        FROM trades{where}""", params).fetchone()
+    return kpis_from_aggregates(dict(zip(["trade_count", "total_profit", "win_count", "avg_win", "avg_loss", "avg_holding"], row)))
+
+def longest_runs(flags):
+    # Longest run of True values, via run-length encoding (no Python loop over trades)
+    if len(flags) == 0: return 0, None
+    padded = np.concatenate(([False], flags, [False])).astype(np.int8)
+    edges = np.flatnonzero(np.diff(padded))
+    if len(edges) == 0: return 0, None
+    starts, ends = edges[::2], edges[1::2]
+    i = int(np.argmax(ends - starts))
+    return int(ends[i] - starts[i]), (int(starts[i]), int(ends[i]))
+
+def compute_risk_metrics(df):
+    # Drawdown / streak / risk-adjusted metrics from one set of numpy arrays over the (chronological) frame.
+    # Equity is rebuilt from cumulative profit so strategy/ticker filters get their own drawdown curve.
+    profit = np.nan_to_num(df['profit'].to_numpy(dtype=float))
+    roi = df['roi'].to_numpy(dtype=float)
+    roi = roi[~np.isnan(roi)]
+    metrics = {"max_drawdown": 0.0, "max_drawdown_pct": 0.0, "drawdown_trades": 0, "drawdown_days": 0.0,
+               "win_streak": 0, "loss_streak": 0, "sharpe": 0.0, "sortino": 0.0, "expectancy": 0.0, "profit_factor": 0.0}
+    if len(profit) == 0: return metrics
+    
+    start_balance = df['start_balance'].iloc[0]
+    base = start_balance if pd.notna(start_balance) else df['final_balance'].iloc[0] - profit[0]
+    equity = np.concatenate(([base], base + np.cumsum(profit)))
+    peak = np.maximum.accumulate(equity)
+    drawdown = peak - equity
+    trough = int(np.argmax(drawdown))
+    metrics["max_drawdown"] = float(drawdown[trough])
+    metrics["max_drawdown_pct"] = float(drawdown[trough] / peak[trough] * 100) if peak[trough] > 0 else 0.0
+    
+    # Longest underwater stretch: trades from the peak until recovery (or the latest trade if still under)
+    underwater_len, run = longest_runs(drawdown > 0)
+    metrics["drawdown_trades"] = underwater_len
+    if run is not None:
+        times = df['datetime_obj'].to_numpy()
+        peak_i, end_i = max(run[0] - 2, 0), min(run[1] - 1, len(times) - 1) # equity[k] is after trade k-1
+        metrics["drawdown_days"] = float((times[end_i] - times[peak_i]) / np.timedelta64(1, 'D'))
+    
+    metrics["win_streak"] = longest_runs(profit > 0)[0]
+    metrics["loss_streak"] = longest_runs(profit < 0)[0]
+    
+    gross_win, gross_loss = profit[profit > 0].sum(), -profit[profit < 0].sum()
+    metrics["expectancy"] = float(profit.mean())
+    metrics["profit_factor"] = float(gross_win / gross_loss) if gross_loss > 0 else (np.inf if gross_win > 0 else 0.0)
+    if len(roi) > 1:
+        std = roi.std(ddof=1)
+        downside = np.sqrt(np.mean(np.minimum(roi, 0) ** 2))
+        metrics["sharpe"] = float(roi.mean() / std) if std > 0 else 0.0
+        metrics["sortino"] = float(roi.mean() / downside) if downside > 0 else 0.0
+    return metrics
+
+def get_analytics_kpis(supabase: Client, df_filtered, strategies, tickers, period, recent_limit):
+    # Aggregates are pushed to Postgres when the RPC exists; pandas over df_filtered otherwise, and while local
+    # saves are still waiting for replication (the server would not count them yet)
+    if supabase and st.session_state.kpi_rpc_available and not st.session_state.local_pending:
+        history_key = (st.session_state.last_trade_id, len(st.session_state.full_history))
+        try:
+            return fetch_kpis_from_supabase(supabase, st.session_state.user_id, tuple(strategies), tuple(tickers),
+                                            PERIOD_DAYS.get(period), recent_limit, history_key)
+        except Exception:
+            st.session_state.kpi_rpc_available = False # RPC not deployed -> stop trying this session
+    return compute_kpis(df_filtered)
+
+# --- AI Coach Helpers ---
+
+COACH_MODEL = "gpt-4"
+COACH_SYSTEM_PROMPT = "You are a professional trading coach. Be concise and constructive."
+COACH_TIMEOUT_S = 60
+COACH_TIMEOUT_NOTE = "⏱️ AI Coach timed out."
+
+# Persistent feedback cache: identical model + prompts -> stored reply (SQLite, TTL + LRU size cap)
+COACH_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "coach_feedback.sqlite3")
+COACH_CACHE_TTL_S = 30 * 24 * 3600
+COACH_CACHE_MAX_ENTRIES = 5000
+
+def coach_cache_key(messages, model=COACH_MODEL):
+    payload = json.dumps({"model": model, "messages": messages}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _coach_cache_connect():
+    os.makedirs(os.path.dirname(COACH_CACHE_PATH), exist_ok=True)
+    conn = sqlite3.connect(COACH_CACHE_PATH, timeout=5)
+    conn.execute("CREATE TABLE IF NOT EXISTS coach_feedback (key TEXT PRIMARY KEY, feedback TEXT NOT NULL, created_at REAL NOT NULL, last_used REAL NOT NULL)")
+    return conn
+
+def coach_cache_get(key):
+    try:
+        with closing(_coach_cache_connect()) as conn, conn:
+            row = conn.execute("SELECT feedback FROM coach_feedback WHERE key = ? AND created_at > ?",
+                               (key, time.time() - COACH_CACHE_TTL_S)).fetchone()
+            if row:
+                conn.execute("UPDATE coach_feedback SET last_used = ? WHERE key = ?", (time.time(), key))
+            return row[0] if row else None
+    except sqlite3.Error:
+        return None # Cache is best-effort
+
+def coach_cache_put(key, feedback):
+    now = time.time()
+    try:
+        with closing(_coach_cache_connect()) as conn, conn:
+            conn.execute("INSERT OR REPLACE INTO coach_feedback VALUES (?, ?, ?, ?)", (key, feedback, now, now))
+            conn.execute("DELETE FROM coach_feedback WHERE created_at <= ?", (now - COACH_CACHE_TTL_S,))
+            conn.execute("DELETE FROM coach_feedback WHERE key NOT IN (SELECT key FROM coach_feedback ORDER BY last_used DESC LIMIT ?)",
+                         (COACH_CACHE_MAX_ENTRIES,))
+    except sqlite3.Error:
+        pass
+
+def build_coach_messages(trade_data):
+    memos = trade_data.get("memos") or []
+    memo_str = "\n".join([f"- {m.get('time', '')} {m.get('text', '')}" if isinstance(m, dict) else f"- {m}" for m in memos]) if memos else "None"
+    prompt = f"""
+                        [Trade Data]
+                        Strategy: {trade_data.get('strategy_name', 'Unknown')}
+                        Result: {trade_data.get('result_status', '')} (${trade_data.get('profit', 0.0):,.0f}, {trade_data.get('roi', 0.0):.2f}%)
+                        Review: {trade_data.get('review', '')}
+                        Memos: {memo_str}
+                        
+                        Provide 3 concise, bullet-pointed feedback items for this trader in English.
+                        """
+    return [
+        {"role": "system", "content": COACH_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+def stream_coach_feedback(messages, timeout=COACH_TIMEOUT_S):
+    # Token generator for st.write_stream; closing it (rerun / cancel) closes the HTTP stream
+    deadline = time.monotonic() + timeout
+    stream = openai.chat.completions.create(model=COACH_MODEL, messages=messages, stream=True, timeout=timeout)
+    try:
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            if time.monotonic() > deadline:
+                yield f"\n\n{COACH_TIMEOUT_NOTE}"
+                break
+    finally:
+        stream.close()
+
+# Batch review of past trades: bounded concurrency, retry with backoff on rate limits / transient errors
+COACH_BATCH_CONCURRENCY = 4
+COACH_BATCH_MAX_RETRIES = 5
+COACH_REVIEW_COLUMNS = "id, strategy_name, result_status, profit, roi, review, memos"
+
+def request_coach_feedback(messages, timeout=COACH_TIMEOUT_S):
+    for attempt in range(COACH_BATCH_MAX_RETRIES + 1):
+        try:
+            response = openai.chat.completions.create(model=COACH_MODEL, messages=messages, timeout=timeout)
+            return response.choices[0].message.content
+        except (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError) as e:
+            if attempt == COACH_BATCH_MAX_RETRIES: raise
+            retry_after = getattr(getattr(e, "response", None), "headers", {}).get("retry-after")
+            try: delay = float(retry_after)
+            except (TypeError, ValueError): delay = min(2 ** attempt, 30)
+            time.sleep(delay)
+
+def fetch_trades_for_review(supabase: Client, user_id, limit, trade_ids=None):
+    # Most recent trades without stored feedback; trade_ids limits non-premium users to visible trades
+    query = supabase.table("trades").select(COACH_REVIEW_COLUMNS).eq("user_id", user_id).is_("ai_feedback", "null")
+    if trade_ids is not None:
+        query = query.in_("id", list(trade_ids))
+    rows = query.order("entry_time", desc=True).limit(limit).execute().data or []
+    return [normalize_trade_row(row) for row in rows]
+
+def review_trade(trade, user_id):
+    # Runs on the batch executor -> no st.* calls in here
+    messages = build_coach_messages(trade)
+    cache_key = coach_cache_key(messages)
+    feedback = coach_cache_get(cache_key)
+    if feedback is None:
+        feedback = request_coach_feedback(messages)
+        coach_cache_put(cache_key, feedback)
+    enqueue_write("update", "trades", {"ai_feedback": feedback}, match={"id": trade["id"]}, user_id=user_id)
+    return feedback
+
+def run_batch_review(supabase: Client, trades):
+    progress = st.progress(0.0, text=f"🤖 Reviewing 0/{len(trades)} trades...")
+    done, failed = 0, []
+    # Not a `with` block: its exit would wait for every queued review. A rerun / stop mid-batch cancels
+    # the queued ones instead (in-flight calls finish on their own)
+    executor = ThreadPoolExecutor(max_workers=COACH_BATCH_CONCURRENCY)
+    try:
+        futures = {executor.submit(review_trade, trade, st.session_state.user_id): trade for trade in trades}
+        for future in as_completed(futures):
+            trade = futures[future]
+            done += 1
+            if future.exception() is not None:
+                failed.append((trade["id"], future.exception()))
+            st.session_state.trade_details.pop(trade["id"], None) # Detail panel re-fetches with feedback
+            progress.progress(done / len(trades), text=f"🤖 Reviewing {done}/{len(trades)} trades...")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        wake_replicator(supabase) # Feedback of the reviews that did finish
+    return len(trades) - len(failed), failed
+
+# Pattern summary: aggregates + a few sampled trades, so the prompt size is bounded regardless of history size
+COACH_PATTERN_DIMENSIONS = {"strategy_name": "Strategy", "ticker": "Ticker", "mood": "Mood"}
+COACH_PATTERN_TOP_N = 8
+COACH_PATTERN_SAMPLES = 4
+COACH_PATTERN_TEXT_CHARS = 300
+
+def group_digest_lines(df, col, top_n=COACH_PATTERN_TOP_N):
+    # Most-traded groups only; the remainder is folded into one line
+    stats = df.assign(win=(df['profit'] > 0) * 100.0).groupby(col, observed=True).agg(
+        trades=('profit', 'size'), win_rate=('win', 'mean'), avg_profit=('profit', 'mean'))
+    stats = stats.sort_values('trades', ascending=False)
+    lines = [f"- {name}: {int(row.trades)} trades, win {row.win_rate:.0f}%, avg ${row.avg_profit:+,.0f}"
+             for name, row in stats.head(top_n).iterrows()]
+    if len(stats) > top_n:
+        lines.append(f"- ({len(stats) - top_n} more, {int(stats['trades'].iloc[top_n:].sum())} trades)")
+    return lines
+
+def build_pattern_digest(df):
+    profit = df['profit']
+    wins, losses = profit[profit > 0], profit[profit < 0]
+    avg_win = wins.mean() if not wins.empty else 0.0
+    avg_loss = abs(losses.mean()) if not losses.empty else 0.0
+    lines = [f"Trades: {len(df)}, win rate {(profit > 0).mean() * 100:.1f}%, total ${profit.sum():+,.0f}",
+             f"Avg win ${avg_win:,.0f} / avg loss ${avg_loss:,.0f} (R:R {avg_win / avg_loss if avg_loss > 0 else 0:.2f})"]
+    for col, title in COACH_PATTERN_DIMENSIONS.items():
+        lines += [f"[By {title}]", *group_digest_lines(df, col)]
+    time_edge = time_edge_stats(df)
+    counts = pd.cut(df['duration_minutes'], bins=[-np.inf, *DURATION_BIN_EDGES, np.inf], labels=time_edge['Duration']).value_counts()
+    lines.append("[By Holding Time]")
+    lines += [f"- {label}: {counts[label]} trades, win {rate:.0f}%" for label, rate in zip(time_edge['Duration'], time_edge['Win Rate'])
+              if counts[label] > 0]
+    return "\n".join(lines)
+
+def sample_pattern_trades(df, n=COACH_PATTERN_SAMPLES):
+    # Representative picks: best, worst, latest loss, latest win (deduplicated)
+    if df.empty: return df
+    picks = [df['profit'].idxmax(), df['profit'].idxmin()]
+    for is_win in (False, True):
+        side = df[(df['profit'] > 0) == is_win]
+        if not side.empty: picks.append(side['datetime_obj'].idxmax())
+    return df.loc[list(dict.fromkeys(picks))[:n]]
+
+def build_pattern_messages(digest, samples, details):
+    def clip(text): return str(text or "")[:COACH_PATTERN_TEXT_CHARS]
+    sample_lines = []
+    for (_, row), detail in zip(samples.iterrows(), details):
+        sample_lines.append(f"- {row['date_str']} {row['ticker']} / {row['strategy_name']} / {row['mood']}: "
+                            f"{row['result_status']} ${row['profit']:+,.0f} ({row['roi']:+.2f}%), {row['duration_minutes']:.0f}m. "
+                            f"Review: {clip(detail.get('review'))}")
+    prompt = f"""
+                        [Aggregated Stats]
+                        {digest}
+                        
+                        [Sample Trades]
+                        {chr(10).join(sample_lines) or "None"}
+                        
+                        Identify the 3 most important recurring patterns (strengths or leaks) in this trader's behaviour,
+                        citing the numbers above, and give one concrete fix for each. Answer in English, bullet points.
+                        """
+    return [
+        {"role": "system", "content": COACH_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+def save_ai_feedback(supabase: Client, ref, feedback):
+    # Finished feedback is stored on the trade row so it is never regenerated (queued like every other write).
+    # Without the ai_feedback column (sql/trades_ai_feedback.sql not applied) it is kept in this session only
+    try:
+        if st.session_state.ai_feedback_column:
+            enqueue_write("update", "trades", {"ai_feedback": feedback}, match=ref,
+                          user_id=st.session_state.user_id, client_id=ref.get("client_id"))
+            wake_replicator(supabase)
+        # Mirror it locally: the detail panel reads the row (local saves) or the detail cache (server rows)
+        history, matched = [], False
+        for row in st.session_state.full_history:
+            if matches_trade_ref(row, ref):
+                row, matched = dict(row, ai_feedback=feedback), True
+                if row.get("id") in st.session_state.trade_details:
+                    st.session_state.trade_details[row["id"]]["ai_feedback"] = feedback
+            history.append(row)
+        if matched: set_session_history(history)
         return True
     except Exception as e:
-        st.error(f"Save to Supabase Error: {e}")
+        st.error(f"AI Feedback Save Error: {e}")
         return False
 
 # --- 2. Sidebar (User & Settings) ---
@@ -616,6 +2034,9 @@ def register_user(supabase: Client, user_id, password):
         return True
     except: return False
 
+# Replicator starts with the first script run of the process, so writes queued before a restart are drained
+if init_supabase(): get_outbox_replicator(init_supabase())
+
 # [Mobile Optimization] Check Login Status FIRST
 if not st.session_state.user_id:
     st.write("")
@@ -642,9 +2063,7 @@ if not st.session_state.user_id:
                             st.session_state.user_id = uid_input
                             st.session_state.is_premium = user_data[0].get("is_premium", False)
                             with st.spinner(f"☁️ Syncing data..."):
-                                full, recent = load_data_from_supabase(supabase, uid_input)
-                                st.session_state.full_history = full
-                                st.session_state.history = recent
+                                load_history_streamed(supabase, uid_input, st.session_state.is_premium)
                             st.success("Login Success!")
                             st.rerun()
                         else:
@@ -665,8 +2084,7 @@ if not st.session_state.user_id:
                         else:
                             if register_user(supabase, new_uid, new_pw):
                                 st.session_state.user_id = new_uid
-                                st.session_state.full_history = []
-                                st.session_state.history = []
+                                set_session_history([])
                                 st.success("Registered & Logged in!")
                                 st.rerun()
                             else:
@@ -678,14 +2096,35 @@ if not st.session_state.user_id:
 
 # --- Everything below this line only runs if Logged In ---
 
+@st.fragment(run_every=1)
+def watch_history_backfill():
+    future = st.session_state.history_backfill
+    if future is None: return
+    if future.done():
+        st.rerun() # Full rerun merges the older pages
+    else:
+        st.caption("⏳ Loading older trades...")
+
+merge_history_backfill()
+apply_replicated_ids()
+apply_chart_url_patches()
+
 with st.sidebar:
     st.header("👤 User Profile")
     st.success(f"**Welcome, {st.session_state.user_id}!**")
+    if st.session_state.history_backfill is not None:
+        watch_history_backfill() # Polls only while older pages are still loading
     
     if st.button("🚪 Logout", type="secondary"):
+        if st.session_state.history_backfill is not None:
+            st.session_state.history_backfill.cancel()
+            st.session_state.history_backfill = None
         st.session_state.user_id = ""
-        st.session_state.history = []
-        st.session_state.full_history = []
+        st.session_state.trade_details = {}
+        st.session_state.local_pending = set()
+        st.session_state.local_failed = set()
+        st.session_state.columnar_store = None
+        set_session_history([])
         st.rerun()
         
     st.divider()
@@ -757,6 +2196,7 @@ with st.sidebar:
 
 # --- 3. Main Pipeline ---
 st.title("📊 Trading Dashboard")
+render_failed_writes(init_supabase())
 
 # [Step 1] Preparation
 if st.session_state.stage == "PRE_TRADING":
@@ -785,16 +2225,21 @@ if st.session_state.stage == "PRE_TRADING":
     supabase = init_supabase()
     if not st.session_state.full_history and supabase and st.session_state.user_id:
         with st.spinner(f"☁️ Syncing data..."):
-            full, recent = load_data_from_supabase(supabase, st.session_state.user_id)
-            if full:
-                st.session_state.full_history = full
-                st.session_state.history = recent
-            else: pass
+            load_history_streamed(supabase, st.session_state.user_id, st.session_state.is_premium)
     elif st.session_state.history:
-        if st.button("🔄 Force Resync"):
-             st.session_state.full_history = []
-             st.session_state.history = []
-             st.rerun()
+        c_sync, c_resync = st.columns(2)
+        with c_sync:
+            if st.button("⬇️ Sync New Trades", help="Fetch only trades saved since the last load (e.g. from another device)"):
+                 if supabase:
+                     with st.spinner(f"☁️ Syncing data..."):
+                         sync_history(supabase, st.session_state.user_id)
+                 st.rerun()
+        with c_resync:
+            if st.button("🔄 Force Resync", help="Reload the whole history from the server"):
+                 if supabase:
+                     with st.spinner(f"☁️ Syncing data..."):
+                         reload_history(supabase, st.session_state.user_id)
+                 st.rerun()
     
     with st.form("pre_trading_form"):
         default_balance = 0.0
@@ -809,7 +2254,9 @@ if st.session_state.stage == "PRE_TRADING":
         # Card 2: Ticker
         with st.container(border=True):
             st.markdown('<div class="input-header"><span class="input-header-icon">🎯</span> Ticker / Asset</div>', unsafe_allow_html=True)
-            existing_tickers = sorted(list(set([str(h.get('ticker', 'Unknown')) for h in st.session_state.full_history]))) if st.session_state.full_history else []
+            # Normally already synced by set_session_history; O(1) when nothing changed
+            st.session_state.trade_vocab = sync_trade_vocab(st.session_state.trade_vocab, st.session_state.full_history)
+            existing_tickers = vocab_options(st.session_state.trade_vocab, "ticker")
             ticker_option = st.selectbox("Ticker Select", ["Create New..."] + existing_tickers, label_visibility="collapsed")
             if ticker_option == "Create New...":
                 st.markdown("<div style='height: 5px'></div>", unsafe_allow_html=True) 
@@ -820,10 +2267,10 @@ if st.session_state.stage == "PRE_TRADING":
         # Card 3: Strategy
         with st.container(border=True):
             st.markdown('<div class="input-header"><span class="input-header-icon">📄</span> Strategy</div>', unsafe_allow_html=True)
-            existing_strategies = list(set([str(h.get('strategy_name', 'General')) for h in st.session_state.full_history])) if st.session_state.full_history else []
-            if "General" not in existing_strategies: existing_strategies.append("General")
+            existing_strategies = vocab_options(st.session_state.trade_vocab, "strategy_name")
+            if "General" not in existing_strategies: existing_strategies = [*existing_strategies, "General"]
             
-            strategy_option = st.selectbox("Strat Select", ["Create New..."] + sorted([str(x) for x in existing_strategies]), label_visibility="collapsed")
+            strategy_option = st.selectbox("Strat Select", ["Create New..."] + existing_strategies, label_visibility="collapsed")
             if strategy_option == "Create New...":
                  st.markdown("<div style='height: 5px'></div>", unsafe_allow_html=True)
                  strategy_name = st.text_input("New Strat Name", placeholder="e.g. Trend Breakout", label_visibility="collapsed")
@@ -851,14 +2298,15 @@ if st.session_state.stage == "PRE_TRADING":
             else:
                 st.session_state.trade_data = {
                     "start_balance": start_balance,
-                    "ticker": ticker_input,
-                    "strategy_name": strategy_name,
+                    "ticker": vocab_canonical(st.session_state.trade_vocab, "ticker", ticker_input),
+                    "strategy_name": vocab_canonical(st.session_state.trade_vocab, "strategy_name", strategy_name),
                     "strategy": strategy_detail,
                     "mood": mood,
                     "entry_time": datetime.now(KST), # FIX: Use KST
                     "entry_time_str": datetime.now(KST).strftime("%H:%M:%S") # FIX: Use KST
                 }
                 st.session_state.stage = "TRADING"
+                st.session_state.coach_request = None
                 st.session_state.analysis_result = None
                 st.session_state.memos = [] 
                 st.rerun()
@@ -1156,9 +2604,18 @@ elif st.session_state.stage == "POST_TRADING":
             st.markdown('<div class="card-header">🖼️ Chart Screenshot</div>', unsafe_allow_html=True)
             uploaded_file = st.file_uploader(
                 "Upload Image",
-                type=['png', 'jpg', 'jpeg'],
+                type=['png', 'jpg', 'jpeg', 'webp'],
                 label_visibility="collapsed"
             )
+            if uploaded_file is None:
+                st.session_state.chart_upload = None
+            elif init_supabase():
+                chart_upload = start_chart_upload(init_supabase(), uploaded_file)
+                if chart_upload["future"].done():
+                    chart_url, chart_error = chart_upload_result(chart_upload["future"])
+                    st.caption("✅ Chart uploaded" if chart_url else f"⚠️ Chart upload failed: {chart_error}")
+                else:
+                    st.caption("⏳ Uploading chart in the background...")
             
         # 7. Satisfaction Slider
         with st.container(border=True):
@@ -1178,22 +2635,17 @@ elif st.session_state.stage == "POST_TRADING":
             if st.button("💾 Save Trade", type="primary", use_container_width=True):
                 supabase = init_supabase()
                 
-                # Image Upload
+                # Image Upload (started in the background when the file was attached)
                 chart_url = ""
+                chart_future = None
                 if uploaded_file is not None:
-                    if supabase:
-                        with st.spinner("Optimizing & Uploading Image..."):
-                            try:
-                                optimized_io = optimize_image_high_quality(uploaded_file)
-                                if optimized_io:
-                                    url = upload_image_to_supabase(supabase, optimized_io, bucket_name="trade_images")
-                                    if url:
-                                        chart_url = url
-                                        st.success("✅ Image Uploaded!")
-                                    else:
-                                        st.error("Upload failed.")
-                            except Exception as e:
-                                st.warning(f"Image upload skipped: {e}")
+                    if supabase and st.session_state.chart_upload:
+                        chart_future = st.session_state.chart_upload["future"]
+                        if chart_future.done():
+                            chart_url, chart_error = chart_upload_result(chart_future)
+                            chart_url = chart_url or ""
+                            if not chart_url: st.error(f"Upload failed. {chart_error}")
+                            chart_future = None
                     else:
                         st.error("Supabase not connected.")
                 
@@ -1228,47 +2680,34 @@ elif st.session_state.stage == "POST_TRADING":
                     "exit_time": exit_dt
                 })
                 
-                # AI Feedback
-                ai_feedback = "AI Feedback not available (API Key missing)."
-                if openai.api_key:
-                    try:
-                        memo_str = "\n".join([f"- {m['time']} {m['text']}" for m in st.session_state.memos]) if st.session_state.memos else "None"
-                        prompt = f"""
-                        [Trade Data]
-                        Strategy: {data.get('strategy_name', 'Unknown')}
-                        Result: {result_status_option} (${profit:,.0f}, {roi:.2f}%)
-                        Review: {review_note}
-                        Memos: {memo_str}
-                        
-                        Provide 3 concise, bullet-pointed feedback items for this trader in English.
-                        """
-                        with st.spinner("🤖 AI Coach Analyzing..."):
-                            response = openai.chat.completions.create(
-                                model="gpt-4",
-                                messages=[
-                                    {"role": "system", "content": "You are a professional trading coach. Be concise and constructive."},
-                                    {"role": "user", "content": prompt}
-                                ]
-                            )
-                            ai_feedback = response.choices[0].message.content
-                    except Exception as e:
-                        ai_feedback = f"AI Error: {e}"
+                # Save to Database first; AI feedback streams in the result view afterwards
+                saved = False
+                saved_row = save_trade_to_supabase(supabase, st.session_state.trade_data, st.session_state.user_id)
+                if saved_row:
+                    # Append the local row right away; the replicator pushes it to Supabase in the background
+                    set_session_history(merge_trades(st.session_state.full_history, [normalize_trade_row(saved_row)]))
+                    st.session_state.local_pending.add(saved_row["client_id"])
+                    st.session_state.trade_data.update(id=None, client_id=saved_row["client_id"])
+                    if chart_future is not None:
+                        # Upload still running -> chart_url is patched in when it finishes
+                        ref = trade_ref(saved_row)
+                        chart_future.add_done_callback(partial(patch_trade_chart_url, ref, st.session_state.user_id))
+                        st.session_state.pending_chart_patches.append((ref, chart_future))
+                    st.session_state.chart_upload = None
+                    st.success("✅ Trade Saved Successfully!")
+                    if not supabase:
+                        st.warning("Database connection missing. The trade is kept in the local store and syncs once it is back.")
+                    saved = True
                 
-                st.session_state.analysis_result = ai_feedback
-
-                # Save to Database
-                if supabase:
-                    with st.spinner("Saving to Database..."):
-                        success = save_trade_to_supabase(supabase, st.session_state.trade_data, st.session_state.user_id)
-                        if success:
-                            # Refresh History
-                            full, recent = load_data_from_supabase(supabase, st.session_state.user_id)
-                            st.session_state.full_history = full
-                            st.session_state.history = recent
-                            st.success("✅ Trade Saved Successfully!")
-                            st.rerun()
-                else:
-                    st.error("Database connection missing. Trade stored locally in session only.")
+                if saved:
+                    if openai.api_key:
+                        st.session_state.coach_request = {
+                            "trade_ref": trade_ref(st.session_state.trade_data),
+                            "messages": build_coach_messages(st.session_state.trade_data),
+                        }
+                        st.session_state.analysis_result = ""
+                    else:
+                        st.session_state.analysis_result = "AI Feedback not available (API Key missing)."
                     st.rerun()
 
     else:
@@ -1281,7 +2720,32 @@ elif st.session_state.stage == "POST_TRADING":
             
         st.divider()
         st.subheader("💡 AI Coach Feedback")
-        st.info(st.session_state.analysis_result)
+        coach_request = st.session_state.coach_request
+        if coach_request is not None:
+            if st.button("⏹ Cancel AI Feedback"):
+                st.session_state.coach_request = None
+                st.session_state.analysis_result = "AI feedback cancelled."
+                st.rerun()
+            cache_key = coach_cache_key(coach_request["messages"])
+            feedback = coach_cache_get(cache_key)
+            completed = feedback is not None
+            if feedback is None:
+                try:
+                    with st.container(border=True):
+                        feedback = st.write_stream(stream_coach_feedback(coach_request["messages"]))
+                    completed = COACH_TIMEOUT_NOTE not in feedback
+                    if completed: coach_cache_put(cache_key, feedback)
+                except Exception as e:
+                    feedback = f"AI Error: {e}"
+                    completed = False
+            st.session_state.analysis_result = feedback
+            st.session_state.coach_request = None
+            supabase = init_supabase()
+            if completed:
+                save_ai_feedback(supabase, coach_request["trade_ref"], feedback)
+            st.rerun()
+        else:
+            st.info(st.session_state.analysis_result)
         
         st.markdown("#### 📝 My Review")
         st.write(r_data['review'])
@@ -1296,6 +2760,7 @@ elif st.session_state.stage == "POST_TRADING":
         with col_res1:
             if st.button("🔄 Start New Trade"):
                 st.session_state.stage = "PRE_TRADING"
+                st.session_state.coach_request = None
                 st.session_state.analysis_result = None
                 st.session_state.memos = []
                 st.rerun()
@@ -1320,31 +2785,17 @@ elif st.session_state.stage == "ANALYTICS":
             st.session_state.stage = "PRE_TRADING"
             st.rerun()
     else:
-        df_all = pd.DataFrame(full_data)
-        
-        df_all['datetime_obj'] = pd.to_datetime(df_all['entry_time'], utc=True)
-        df_all['date_str'] = df_all['datetime_obj'].dt.strftime('%m/%d')
-        
-        if 'strategy_name' not in df_all.columns: df_all['strategy_name'] = "General"
-        df_all['strategy_name'] = df_all['strategy_name'].fillna("General")
-        
-        if 'ticker' not in df_all.columns: df_all['ticker'] = "Unknown"
-        df_all['ticker'] = df_all['ticker'].fillna("Unknown").astype(str)
-        
-        if "profit" not in df_all.columns: df_all['profit'] = 0.0
-        if "roi" not in df_all.columns: df_all['roi'] = 0.0
-        
-        total_count = len(df_all)
-        recent_limit = 20
-        df_all['is_locked'] = False
-        
-        if (not is_premium) and (total_count > recent_limit):
-             df_all.loc[:total_count-recent_limit-1, 'is_locked'] = True
-        
-        if is_premium:
-             df_analytics = df_all.copy()
+        recent_limit = RECENT_LIMIT
+        columnar = columnar_enabled(full_data, is_premium)
+        if columnar:
+            st.session_state.analytics_frame = None # Queries run on DuckDB; no full pandas frame per session
+            con = get_columnar_connection()
         else:
-             df_analytics = df_all.iloc[-recent_limit:].copy()
+            df_all = get_analytics_frame()
+            if is_premium:
+                 df_analytics = df_all
+            else:
+                 df_analytics = df_all.iloc[-recent_limit:]
         
         top_left, top_right = st.columns([1, 1], gap="medium")
         
@@ -1356,40 +2807,47 @@ elif st.session_state.stage == "ANALYTICS":
                 period_options = ["All Time", "Last 7 Days", "Last 30 Days", "Last 30 Trades"]
                 period_filter = st.selectbox("Filter by Period", period_options)
             with f_col2:
-                all_strats = sorted([str(x) for x in df_analytics['strategy_name'].unique()])
+                all_strats = columnar_distinct(con, 'strategy_name') if columnar else sorted([str(x) for x in df_analytics['strategy_name'].unique()])
                 strategy_filter = st.multiselect("Filter by Strategy", all_strats, default=all_strats)
             with f_col3:
-                all_tickers = sorted([str(x) for x in df_analytics['ticker'].unique()])
+                all_tickers = columnar_distinct(con, 'ticker') if columnar else sorted([str(x) for x in df_analytics['ticker'].unique()])
                 ticker_filter = st.multiselect("Filter by Ticker", all_tickers, default=all_tickers)
         
-            df_filtered = df_analytics.copy()
-            
-            if strategy_filter:
-                df_filtered = df_filtered[df_filtered['strategy_name'].astype(str).isin(strategy_filter)]
-            
-            if ticker_filter:
-                df_filtered = df_filtered[df_filtered['ticker'].isin(ticker_filter)]
-            
-            if period_filter == "Last 7 Days":
-                cutoff = datetime.now(timezone.utc) - timedelta(days=7)
-                df_filtered = df_filtered[df_filtered['datetime_obj'] >= cutoff]
-            elif period_filter == "Last 30 Days":
-                cutoff = datetime.now(timezone.utc) - timedelta(days=30)
-                df_filtered = df_filtered[df_filtered['datetime_obj'] >= cutoff]
+            if columnar:
+                df_filtered = columnar_filtered_frame(con, strategy_filter, ticker_filter, period_filter)
+            else:
+                mask = pd.Series(True, index=df_analytics.index)
+                
+                if strategy_filter:
+                    mask &= df_analytics['strategy_name'].isin(strategy_filter)
+                
+                if ticker_filter:
+                    mask &= df_analytics['ticker'].isin(ticker_filter)
+                
+                if period_filter in PERIOD_DAYS:
+                    cutoff = datetime.now(timezone.utc) - timedelta(days=PERIOD_DAYS[period_filter])
+                    mask &= df_analytics['datetime_obj'] >= cutoff
+                
+                df_filtered = df_analytics[mask]
 
             if df_filtered.empty:
                 st.caption("No recent trades match filters.")
-                
-            total_profit = df_filtered['profit'].sum()
+            
+            if columnar:
+                kpis = columnar_kpis(con, strategy_filter, ticker_filter, period_filter)
+            else:
+                kpis = get_analytics_kpis(init_supabase(), df_filtered, strategy_filter, ticker_filter, period_filter,
+                                          None if is_premium else recent_limit)
+            total_profit = kpis["total_profit"]
             
             real_current_balance = 0.0
-            if not df_all.empty:
+            if columnar:
+                real_current_balance = float(full_data[-1].get('final_balance') or 0.0)
+            elif not df_all.empty:
                 real_current_balance = df_all.iloc[-1]['final_balance']
 
-            win_count = len(df_filtered[df_filtered['profit'] > 0])
-            total_count_filtered = len(df_filtered)
-            win_rate = (win_count / total_count_filtered * 100) if total_count_filtered > 0 else 0
-            avg_holding = df_filtered['duration_minutes'].mean() if 'duration_minutes' in df_filtered.columns else 0
+            win_rate = kpis["win_rate"]
+            avg_holding = kpis["avg_holding"]
 
             m_r1_c1, m_r1_c2, m_r1_c3 = st.columns(3)
             with m_r1_c1:
@@ -1410,21 +2868,39 @@ elif st.session_state.stage == "ANALYTICS":
             st.write("")
             
             m_r2_c1, m_r2_c2, m_r2_c3 = st.columns(3)
-            avg_win = df_filtered[df_filtered['profit'] > 0]['profit'].mean() if not df_filtered[df_filtered['profit'] > 0].empty else 0
-            avg_loss = abs(df_filtered[df_filtered['profit'] < 0]['profit'].mean()) if not df_filtered[df_filtered['profit'] < 0].empty else 0
-            pl_ratio = avg_win / avg_loss if avg_loss > 0 else 0
+            avg_win = kpis["avg_win"]
+            avg_loss = kpis["avg_loss"]
+            pl_ratio = kpis["pl_ratio"]
             
             with m_r2_c1: st.metric("⚖️ Avg P/L Ratio", f"{pl_ratio:.2f}")
             with m_r2_c2: st.metric("⏳ Avg Holding", f"{avg_holding:.0f}m")
+            
+            risk = compute_risk_metrics(df_filtered)
+            with m_r2_c3: st.metric("🎯 Expectancy", f"${risk['expectancy']:+,.0f}", help="Average profit per trade")
+            
+            st.write("")
+            
+            m_r3_c1, m_r3_c2, m_r3_c3 = st.columns(3)
+            with m_r3_c1:
+                st.metric("📉 Max Drawdown", f"${risk['max_drawdown']:,.0f}", f"-{risk['max_drawdown_pct']:.1f}%", delta_color="normal" if risk['max_drawdown'] > 0 else "off")
+            with m_r3_c2:
+                pf = risk['profit_factor']
+                st.metric("🏭 Profit Factor", "∞" if np.isinf(pf) else f"{pf:.2f}", help="Gross profit / gross loss")
+            with m_r3_c3:
+                st.metric("📐 Sharpe / Sortino", f"{risk['sharpe']:.2f} / {risk['sortino']:.2f}", help="Per-trade ROI, not annualized")
+            st.caption(f"🔥 Longest streaks: {risk['win_streak']}W / {risk['loss_streak']}L · "
+                       f"⏱️ Longest drawdown: {risk['drawdown_trades']} trades ({risk['drawdown_days']:.1f} days)")
         
         with top_right:
             st.markdown("### 💸 Equity Curve (Recent 20)")
-            chart_df = df_filtered.reset_index(drop=True)
-            chart_df['trade_num'] = range(1, len(chart_df) + 1)
-            chart_df['trade_label'] = chart_df.apply(lambda x: f"{x['trade_num']} ({str(x['date_str'])})", axis=1)
+            x_axis_mode = st.radio("Equity X-Axis", list(EQUITY_X_AXIS), horizontal=True, label_visibility="collapsed",
+                                   index=0 if len(df_filtered) <= EQUITY_LABEL_AXIS_MAX else 1)
+            chart_df = df_filtered[['datetime_obj', 'date_str', 'final_balance']].reset_index(drop=True)
+            chart_df['trade_num'] = np.arange(1, len(chart_df) + 1)
+            if x_axis_mode == "Trade Label":
+                chart_df['trade_label'] = chart_df['trade_num'].astype(str) + " (" + chart_df['date_str'].astype(str) + ")"
             
-            fig = px.area(chart_df, x='trade_label', y='final_balance', markers=True)
-            fig.update_traces(line_color='#AB63FA', line_shape='spline', fillcolor='rgba(171, 99, 250, 0.2)')
+            fig = build_equity_figure(chart_df, EQUITY_X_AXIS[x_axis_mode])
             fig.update_layout(xaxis_title=None, yaxis_title="Balance ($)", height=400, margin=dict(l=20, r=20, t=10, b=20))
             
             if not chart_df.empty:
@@ -1442,26 +2918,9 @@ elif st.session_state.stage == "ANALYTICS":
         
         with col_mid1:
             st.markdown("###### ⏳ Time Edge")
-            def get_duration_bin(minutes):
-                if minutes <= 60: return "0-1h"
-                elif minutes <= 180: return "1-3h"
-                elif minutes <= 360: return "3-6h"
-                elif minutes <= 720: return "6-12h"
-                elif minutes <= 1440: return "12-24h"
-                else: return "24h+"
             
             if 'duration_minutes' in df_filtered.columns:
-                df_filtered['duration_bin'] = df_filtered['duration_minutes'].apply(get_duration_bin)
-                bin_stats = []
-                for b in ["0-1h", "1-3h", "3-6h", "6-12h", "12-24h", "24h+"]:
-                    subset = df_filtered[df_filtered['duration_bin'] == b]
-                    if not subset.empty:
-                        wins = len(subset[subset['profit'] > 0])
-                        rate = (wins / len(subset)) * 100
-                        bin_stats.append({'Duration': b, 'Win Rate': rate})
-                    else:
-                        bin_stats.append({'Duration': b, 'Win Rate': 0.0})
-                bin_df = pd.DataFrame(bin_stats)
+                bin_df = time_edge_stats(df_filtered)
                 fig_time = px.bar(bin_df, x='Duration', y='Win Rate', text='Win Rate', color='Win Rate', color_continuous_scale='RdBu', range_y=[0, 100])
                 fig_time.update_traces(texttemplate='%{text:.0f}%', textposition='outside')
                 fig_time.update_layout(yaxis_title=None, xaxis_title=None, height=300, margin=dict(t=10, b=10, l=10, r=10))
@@ -1470,7 +2929,7 @@ elif st.session_state.stage == "ANALYTICS":
 
         with col_mid2:
             st.markdown("###### 📊 Win/Loss")
-            win_loss_df = df_filtered['result_status'].value_counts().reset_index()
+            win_loss_df = df_filtered['result_status'].value_counts().loc[lambda counts: counts > 0].reset_index()
             win_loss_df.columns = ['Result', 'Count']
             fig_pie = px.pie(win_loss_df, values='Count', names='Result', color='Result', hole=0.5,
                              color_discrete_map={'Win':COLOR_WIN, 'Loss':COLOR_LOSS, 'Break-even':COLOR_BE})
@@ -1489,99 +2948,96 @@ elif st.session_state.stage == "ANALYTICS":
                                  yaxis_title=None, height=300, margin=dict(t=10, b=10, l=10, r=10))
             st.plotly_chart(fig_rr, use_container_width=True)
 
+        st.markdown("###### 🧘 Psychology Edge")
+        if df_filtered.empty:
+            st.caption("No trades match filters.")
+        else:
+            group_sums = trade_group_sums(df_filtered)
+            c_psy1, c_psy2 = st.columns(2)
+            with c_psy1: heat_dim = st.radio("Mood vs", list(MOOD_HEATMAP_DIMENSIONS), horizontal=True)
+            with c_psy2: heat_metric = st.selectbox("Metric", list(MOOD_HEATMAP_METRICS))
+            heat_df = mood_heatmap_frame(group_sums, MOOD_HEATMAP_DIMENSIONS[heat_dim], MOOD_HEATMAP_METRICS[heat_metric])
+            fig_heat = px.imshow(heat_df.astype(float), text_auto='.0f', aspect='auto', color_continuous_scale='RdBu',
+                                 color_continuous_midpoint=50 if MOOD_HEATMAP_METRICS[heat_metric] == "win_rate" else None)
+            fig_heat.update_layout(xaxis_title=None, yaxis_title=None, height=300, margin=dict(t=10, b=10, l=10, r=10))
+            st.plotly_chart(fig_heat, use_container_width=True)
+            
+            mood_table = rollup_group_stats(group_sums, 'mood').sort_values('trades', ascending=False)
+            st.dataframe(mood_table, use_container_width=True, column_config={
+                "trades": st.column_config.NumberColumn("Trades"),
+                "win_rate": st.column_config.NumberColumn("Win Rate", format="%.1f%%"),
+                "expectancy": st.column_config.NumberColumn("Expectancy", format="$%+.0f"),
+                "avg_duration": st.column_config.NumberColumn("Avg Holding", format="%.0fm"),
+                "drawdown_contribution": st.column_config.NumberColumn("DD Contribution", format="%.1f%%",
+                                                                       help="Share of the max drawdown (equity peak to trough in the filter) from these trades"),
+            })
+
         st.divider()
         
         st.markdown("### 📋 Trade History (Full History)")
         st.caption("Older trades are archived to save space and focus on current performance.")
         
-        df_table = df_all.copy()
-        
-        df_table = df_table.sort_values('entry_time', ascending=False).reset_index(drop=True)
-        
-        df_table['is_locked'] = False
-        is_premium = st.session_state.get('is_premium', False)
-        
-        if (not is_premium) and (len(df_table) > 20):
-            df_table.loc[20:, 'is_locked'] = True 
+        if columnar:
+            # Premium only (no archived rows) and already filtered by DuckDB
+            df_table = df_filtered.sort_values('datetime_obj', ascending=False).reset_index(drop=True)
+        else:
+            df_table = get_history_table_frame()
+            table_mask = pd.Series(True, index=df_table.index)
             
-        if 'strategy_detail' in df_table.columns: df_table['Detail'] = df_table['strategy_detail']
-        elif 'strategy' in df_table.columns: df_table['Detail'] = df_table['strategy']
-        else: df_table['Detail'] = ""
-        
-        for idx in df_table.index:
-            if df_table.loc[idx, 'is_locked']:
-                df_table.loc[idx, 'ticker'] = "🔒 Archived"
-                df_table.loc[idx, 'strategy_name'] = "****"
-                df_table.loc[idx, 'result_status'] = "Archived"
-                df_table.loc[idx, 'profit'] = 0.0
-                df_table.loc[idx, 'roi'] = 0.0
-                df_table.loc[idx, 'mood'] = "🔒"
-                df_table.loc[idx, 'Detail'] = "This trade is archived to keep your review focused."
-        
-        if strategy_filter:
-            mask_strategy = df_table['strategy_name'].astype(str).isin(strategy_filter)
-            mask_locked = df_table['is_locked'] == True
-            df_table = df_table[mask_strategy | mask_locked]
-
-        if ticker_filter:
-             mask_ticker = df_table['ticker'].isin(ticker_filter)
-             mask_locked = df_table['is_locked'] == True
-             df_table = df_table[mask_ticker | mask_locked]
-
-        if period_filter == "Last 7 Days":
-            cutoff = datetime.now(timezone.utc) - timedelta(days=7)
-            df_table = df_table[df_table['datetime_obj'] >= cutoff]
-        elif period_filter == "Last 30 Days":
-            cutoff = datetime.now(timezone.utc) - timedelta(days=30)
-            df_table = df_table[df_table['datetime_obj'] >= cutoff]
-        elif period_filter == "Last 30 Trades":
-            df_table = df_table.head(30)
+            if strategy_filter:
+                table_mask &= df_table['strategy_name'].isin(strategy_filter) | df_table['is_locked']
 
-        
-        display_cols = ['date_str', 'ticker', 'strategy_name', 'result_status', 'profit', 'roi', 'mood', 'Detail']
-        display_df = df_table[display_cols].copy()
-        display_df.columns = ['Date', 'Ticker', 'Tag', 'Result', 'Profit($)', 'ROI(%)', 'Mood', 'Detail']
-        
-        def color_result(val):
-            if val == 'Locked' or val == 0.0 or val == 0: 
-                return 'color: #888'
-            
-            try:
-                text = str(val).replace('$', '').replace(',', '').replace('%', '')
-                val_num = float(text)
-                
-                if val_num > 0:
-                    return f'color: {COLOR_WIN}'
-                elif val_num < 0:
-                    return f'color: {COLOR_LOSS}' 
-                else:
-                    return f'color: {COLOR_BE}'
-            except:
-                return 'color: #888'
+            if ticker_filter:
+                table_mask &= df_table['ticker'].isin(ticker_filter) | df_table['is_locked']
+
+            if period_filter in PERIOD_DAYS:
+                cutoff = datetime.now(timezone.utc) - timedelta(days=PERIOD_DAYS[period_filter])
+                table_mask &= df_table['datetime_obj'] >= cutoff
             
-        def color_status_text(val):
-            if val == 'Locked': return 'color: #888; font-style: italic;'
-            if val == 'Win' or val == '익절': return f'color: {COLOR_WIN}; font-weight: bold;'
-            elif val == 'Loss' or val == '손절': return f'color: {COLOR_LOSS}; font-weight: bold;'
-            elif val == 'Break-even' or val == '본절': return f'color: {COLOR_BE}; font-weight: bold;'
-            return 'color: black;'
-
-        styled_df = display_df.style.format({
-            'Profit($)': '${:,.0f}',
-            'ROI(%)': '{:+.2f}%'
-        }).map(color_result, subset=['Profit($)', 'ROI(%)'])\
-          .map(color_status_text, subset=['Result'])
+            df_table = df_table[table_mask]
+        if period_filter == "Last 30 Trades":
+            df_table = df_table.head(30)
+
         
+        total_rows = len(df_table)
+        n_pages = max(1, -(-total_rows // HISTORY_TABLE_PAGE_SIZE))
+        page = 1
+        if n_pages > 1:
+            p_col1, p_col2 = st.columns([1, 4])
+            with p_col1:
+                page = st.number_input("Page", min_value=1, max_value=n_pages, value=1, step=1)
+            with p_col2:
+                st.caption(f"Showing {(page - 1) * HISTORY_TABLE_PAGE_SIZE + 1}-{min(page * HISTORY_TABLE_PAGE_SIZE, total_rows)} of {total_rows} trades")
+        df_table = df_table.iloc[(page - 1) * HISTORY_TABLE_PAGE_SIZE:page * HISTORY_TABLE_PAGE_SIZE]
+        
+        display_cols = ['date_str', 'ticker', 'strategy_name', 'result_status', 'profit', 'roi', 'mood']
+        display_df = df_table[display_cols].reset_index(drop=True)
+        display_df.columns = ['Date', 'Ticker', 'Tag', 'Result', 'Profit($)', 'ROI(%)', 'Mood']
+        # Thumbnail strip: only multi-resolution uploads have a thumb (legacy full-size images are skipped)
+        if st.session_state.local_failed and 'client_id' in df_table.columns:
+            display_df['Sync'] = np.where(df_table['client_id'].isin(st.session_state.local_failed).to_numpy(), "⚠️ Not synced", "")
+        if 'chart_url' in df_table.columns:
+            chart_urls = df_table['chart_url'].astype(object).where(df_table['chart_url'].notna(), "").astype(str)
+            has_thumb = chart_urls.str.contains("/charts/", regex=False) & chart_urls.str.contains("/original.", regex=False)
+            display_df['Chart'] = chart_urls.str.replace(r"/original\.\w+$", "/thumb.webp", regex=True).where(has_thumb, None).to_numpy()
+        
+        # Styler display values win over column_config number formats, so numbers are formatted here.
+        # The key changes with the rows shown, so a selection never carries over to a different page / filter.
+        table_state = (st.session_state.history_version, period_filter, sorted(strategy_filter), sorted(ticker_filter), page)
         event = st.dataframe(
-            styled_df, 
+            display_df.style.format({'Profit($)': '${:,.0f}', 'ROI(%)': '{:+.2f}%'}, na_rep="").apply(history_table_styles, axis=None), 
             use_container_width=True,
+            column_config={
+                'Chart': st.column_config.ImageColumn(width="small"),
+            },
             on_select="rerun",
-            selection_mode="single-row"
+            selection_mode="single-row",
+            key="history_table_" + hashlib.sha256(repr(table_state).encode("utf-8")).hexdigest()[:16]
         )
         
         st.divider()
         
-        if len(event.selection.rows) > 0:
+        if len(event.selection.rows) > 0 and event.selection.rows[0] < len(df_table):
             selected_row_idx = event.selection.rows[0]
             record = df_table.iloc[selected_row_idx]
             
@@ -1615,9 +3071,10 @@ elif st.session_state.stage == "ANALYTICS":
                     """, unsafe_allow_html=True)
             else:
                 with st.container():
+                    details = load_trade_details(init_supabase(), record)
                     st.info(f"📌 Detailed Trade Report ({record['date_str']})")
                     d1, d2, d3 = st.columns(3)
-                    d1.write(f"**Strategy:** [{record.get('strategy_name','General')}] {record.get('Detail','')}")
+                    d1.write(f"**Strategy:** [{record.get('strategy_name','General')}] {details.get('strategy_detail') or ''}")
                     d2.write(f"**Result:** {record['result_status']} (${record['profit']:+,.0f})")
                     d3.write(f"**Mood:** {record['mood']}")
                     st.write("") 
@@ -1652,13 +3109,14 @@ elif st.session_state.stage == "ANALYTICS":
                     st.divider()
                     st.markdown("#### 📷 Trade Chart")
                     if 'chart_url' in record and record['chart_url']:
-                        st.image(record['chart_url'], caption="Chart Image", use_container_width=True)
+                        # Preview first; the full-resolution original only loads when opened
+                        st.image(chart_variant_url(record['chart_url'], "preview"), caption="Chart Image", use_container_width=True)
                         st.markdown(f"[🔗 Open Original]({record['chart_url']})")
                     else: st.caption("📷 No chart image available.")
                     
                     st.write("")
                     st.markdown("#### 📝 Real-time Memos")
-                    memos_data = record.get('memos', [])
+                    memos_data = details.get('memos', [])
                     if isinstance(memos_data, str):
                         try: memos_data = ast.literal_eval(memos_data)
                         except: memos_data = []
@@ -1669,20 +3127,83 @@ elif st.session_state.stage == "ANALYTICS":
                     else: st.caption("No memos recorded")
                     
                     st.markdown("#### 💬 Final Review")
-                    st.write(record['review'])
+                    st.write(details.get('review') or "")
+                    
+                    if details.get('ai_feedback'):
+                        st.markdown("#### 🤖 AI Coach Feedback")
+                        st.info(details['ai_feedback'])
                     
         else:
             st.caption("👆 Click on a trade in the table above to view details.")
         
         st.write("")
+        with st.expander("🧠 AI Pattern Summary (filtered trades)"):
+            if not openai.api_key:
+                st.caption("Enter your OpenAI API Key in the sidebar to enable the pattern summary.")
+            elif df_filtered.empty:
+                st.caption("No trades match filters.")
+            else:
+                st.caption("Sends aggregated stats plus a few sample trades, not your full history.")
+                if st.button("Analyze My Patterns"):
+                    samples = sample_pattern_trades(df_filtered)
+                    details = [load_trade_details(init_supabase(), row.to_dict()) for _, row in samples.iterrows()]
+                    messages = build_pattern_messages(build_pattern_digest(df_filtered), samples, details)
+                    cache_key = coach_cache_key(messages)
+                    summary = coach_cache_get(cache_key)
+                    if summary is not None:
+                        st.markdown(summary)
+                    else:
+                        try:
+                            summary = st.write_stream(stream_coach_feedback(messages))
+                            if COACH_TIMEOUT_NOTE not in summary:
+                                coach_cache_put(cache_key, summary)
+                        except Exception as e:
+                            st.error(f"AI Error: {e}")
+        
+        with st.expander("🤖 Batch AI Review (past trades)"):
+            if not openai.api_key:
+                st.caption("Enter your OpenAI API Key in the sidebar to enable batch review.")
+            elif not st.session_state.ai_feedback_column:
+                st.caption("Batch review stores feedback on each trade: apply sql/trades_ai_feedback.sql to enable it.")
+            else:
+                st.caption("Sends past trades without AI feedback through the coach and stores the result on each trade.")
+                batch_size = st.number_input("Trades to review", min_value=1, max_value=500, value=50, step=10)
+                if st.button("Run Batch Review"):
+                    supabase = init_supabase()
+                    if not supabase:
+                        st.error("Supabase not connected.")
+                    else:
+                        visible_ids = None if is_premium else [int(x) for x in df_analytics['id'].dropna()]
+                        trades = None
+                        try:
+                            trades = fetch_trades_for_review(supabase, st.session_state.user_id, int(batch_size), visible_ids)
+                        except Exception as e:
+                            if is_undefined_column(e):
+                                st.session_state.ai_feedback_column = False
+                                st.info("Batch review stores feedback on each trade: apply sql/trades_ai_feedback.sql to enable it.")
+                            else:
+                                st.error(f"Data Load Error: {e}")
+                        if trades == []:
+                            st.info("All trades already have AI feedback.")
+                        elif trades:
+                            reviewed, failed = run_batch_review(supabase, trades)
+                            st.success(f"✅ {reviewed} trades reviewed.")
+                            for trade_id, error in failed[:5]:
+                                st.warning(f"Trade {trade_id}: {error}")
+        
         st.write("")
         c_btn1, c_btn2 = st.columns(2)
         with c_btn1:
             if st.button("🔄 Start New Trade (to Step 1)"):
                 st.session_state.stage = "PRE_TRADING"
+                st.session_state.coach_request = None
                 st.session_state.analysis_result = None
                 st.session_state.memos = []
                 st.rerun()
         
         with c_btn2:
-             st.success("✅ Cloud Synced (Supabase)")
\ No newline at end of file
+             if st.session_state.local_failed: st.warning("⚠️ Some trades are not synced (see above)")
+             elif st.session_state.local_pending:
+                 retry_error = outbox_retry_error(st.session_state.user_id)
+                 st.info(f"⏳ Syncing to cloud... (retrying: {retry_error})" if retry_error else "⏳ Syncing to cloud...")
+             else: st.success("✅ Cloud Synced (Supabase)")
\ No newline at end of file
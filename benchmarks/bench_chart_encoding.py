@@ -0,0 +1,130 @@
+"""Benchmark: chart screenshot encoding policies (time, bytes, SSIM).
+
+Runs every entry of ``app.IMAGE_POLICIES`` over a corpus of chart screenshots.
+Without arguments a synthetic corpus is generated (dark candlestick charts at
+1080p / 1440p / 4K / dual-4K, plus small JPEG and WebP inputs that exercise
+the pass-through path). Pass image files or directories to use real screenshots.
+
+    python benchmarks/bench_chart_encoding.py [paths...]
+
+SSIM is measured on luma against the source, resized to the encoded dimensions
+when the policy downscales.
+"""
+import io
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+logging.disable(logging.WARNING) # Streamlit bare-mode warnings
+import app  # noqa: E402  (runs the script once in Streamlit bare mode)
+
+
+def synthetic_chart(width, height, seed=0):
+    # Drawn at 2x and downsampled so lines/text are anti-aliased like a real screenshot
+    rng = np.random.default_rng(seed)
+    w, h = width * 2, height * 2
+    gradient = np.linspace(0, 1, h)[:, None, None] * np.array([6, 8, 14]) + np.array([16, 19, 28])
+    image = Image.fromarray(np.broadcast_to(gradient, (h, w, 3)).astype(np.uint8))
+    draw = ImageDraw.Draw(image)
+    for x in range(0, w, w // 16):
+        draw.line([(x, 0), (x, h)], fill=(42, 46, 57), width=2)
+    for y in range(0, h, h // 10):
+        draw.line([(0, y), (w, y)], fill=(42, 46, 57), width=2)
+        draw.text((w - 160, y + 8), f"{60000 + y:,}.5", fill=(178, 181, 190), font_size=28)
+    step = 24
+    n_candles = w // step
+    closes = 0.5 * h + np.cumsum(rng.normal(0, h / 150, n_candles))
+    opens = np.roll(closes, 1)
+    ma = np.convolve(closes, np.ones(20) / 20, mode="same")
+    for i, (o, c) in enumerate(zip(opens, closes)):
+        x = i * step + step // 2
+        wick = abs(rng.normal(0, h / 200))
+        color = (38, 166, 154) if c < o else (239, 83, 80)
+        draw.line([(x, min(o, c) - wick), (x, max(o, c) + wick)], fill=color, width=2)
+        draw.rectangle([x - 8, min(o, c), x + 8, max(o, c) + 2], fill=color)
+        volume = abs(rng.normal(0, h / 20))
+        draw.rectangle([x - 8, h - volume, x + 8, h], fill=tuple(v // 2 for v in color))
+    draw.line([(i * step + step // 2, y) for i, y in enumerate(ma)], fill=(255, 183, 77), width=3)
+    return image.resize((width, height), Image.Resampling.LANCZOS)
+
+
+def synthetic_corpus():
+    corpus = []
+    for name, size in [("1080p", (1920, 1080)), ("1440p", (2560, 1440)), ("4k", (3840, 2160)), ("dual-4k", (7680, 2160))]:
+        buf = io.BytesIO()
+        synthetic_chart(*size).save(buf, format="PNG")
+        corpus.append((f"{name}.png", buf.getvalue()))
+    small = synthetic_chart(1600, 900, seed=1)
+    for fmt, ext in [("JPEG", "jpg"), ("WEBP", "webp")]:
+        buf = io.BytesIO()
+        small.save(buf, format=fmt, quality=85)
+        corpus.append((f"small.{ext}", buf.getvalue()))
+    return corpus
+
+
+def load_corpus(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += [os.path.join(path, name) for name in sorted(os.listdir(path))]
+        else:
+            files.append(path)
+    corpus = []
+    for path in files:
+        if path.lower().endswith((".png", ".jpg", ".jpeg", ".webp")):
+            with open(path, "rb") as f:
+                corpus.append((os.path.basename(path), f.read()))
+    return corpus
+
+
+def _box_mean(x, k=7):
+    c = np.pad(x, ((1, 0), (1, 0))).cumsum(0).cumsum(1)
+    return (c[k:, k:] - c[:-k, k:] - c[k:, :-k] + c[:-k, :-k]) / (k * k)
+
+
+def ssim(a, b):
+    a = np.asarray(a.convert("L"), dtype=np.float64)
+    b = np.asarray(b.convert("L"), dtype=np.float64)
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    mu_a, mu_b = _box_mean(a), _box_mean(b)
+    var_a = _box_mean(a * a) - mu_a ** 2
+    var_b = _box_mean(b * b) - mu_b ** 2
+    cov = _box_mean(a * b) - mu_a * mu_b
+    ssim_map = ((2 * mu_a * mu_b + c1) * (2 * cov + c2)) / ((mu_a ** 2 + mu_b ** 2 + c1) * (var_a + var_b + c2))
+    return float(ssim_map.mean())
+
+
+def run(corpus):
+    print(f"{'image':<14} {'source':>10} | {'policy':<12} {'format':<6} {'time':>9} {'bytes':>10} {'ratio':>6} {'SSIM':>7}")
+    print("-" * 84)
+    totals = {}
+    for name, data in corpus:
+        source = Image.open(io.BytesIO(data))
+        source.load()
+        for policy in app.IMAGE_POLICIES:
+            start = time.perf_counter()
+            output_io, image_format, _ = app.optimize_chart_image(io.BytesIO(data), policy)
+            elapsed = time.perf_counter() - start
+            encoded = output_io.getvalue()
+            decoded = Image.open(io.BytesIO(encoded))
+            reference = source.convert("RGB")
+            if decoded.size != reference.size:
+                reference = reference.resize(decoded.size, Image.Resampling.LANCZOS)
+            score = ssim(reference, decoded)
+            t = totals.setdefault(policy, [0.0, 0, 0, 0.0])
+            t[0] += elapsed; t[1] += len(encoded); t[2] += len(data); t[3] += score
+            print(f"{name:<14} {len(data):>10,} | {policy:<12} {image_format:<6} {elapsed * 1000:>7.0f}ms "
+                  f"{len(encoded):>10,} {len(encoded) / len(data):>6.2f} {score:>7.4f}")
+    print("-" * 84)
+    for policy, (elapsed, out_bytes, in_bytes, score) in totals.items():
+        print(f"{'TOTAL':<14} {in_bytes:>10,} | {policy:<12} {'':<6} {elapsed * 1000:>7.0f}ms "
+              f"{out_bytes:>10,} {out_bytes / in_bytes:>6.2f} {score / len(corpus):>7.4f}")
+
+
+if __name__ == "__main__":
+    run(load_corpus(sys.argv[1:]) if len(sys.argv) > 1 else synthetic_corpus())
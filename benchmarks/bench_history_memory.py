@@ -0,0 +1,72 @@
+"""Benchmark: memory of full_history as list of dicts vs ``app.TradeHistory``.
+
+Measures retained memory (tracemalloc) and build / analytics-frame time at 1k / 10k / 50k trades.
+
+    python benchmarks/bench_history_memory.py [sizes...]
+"""
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+logging.disable(logging.WARNING) # Streamlit bare-mode warnings
+import app  # noqa: E402  (runs the script once in Streamlit bare mode)
+
+
+def make_rows(n, seed=0):
+    # Same shape as rows fetched with app.SUMMARY_COLUMNS
+    rng = np.random.default_rng(seed)
+    kst = timezone(timedelta(hours=9))
+    t0 = datetime(2024, 1, 1, tzinfo=kst)
+    rows, balance = [], 1000.0
+    for i, profit in enumerate(rng.normal(5, 50, n).tolist()):
+        entry = t0 + timedelta(hours=i)
+        rows.append({
+            "id": i + 1, "client_id": os.urandom(16).hex(), "user_id": "trader",
+            "entry_time": entry.isoformat(), "exit_time": (entry + timedelta(minutes=45)).isoformat(),
+            "ticker": str(rng.choice(["BTCUSDT", "ETHUSDT", "SOLUSDT", "XRPUSDT"])),
+            "strategy_name": str(rng.choice(["Breakout", "Pullback", "General"])),
+            "mood": str(rng.choice(["😌 Calm", "😱 FOMO", "🥵 Revenge"])),
+            "start_balance": balance, "final_balance": balance + profit, "profit": profit, "roi": profit / balance * 100,
+            "result_status": "Win" if profit > 0 else "Loss", "satisfaction": 5,
+            "chart_url": f"https://cdn.example.com/charts/{i:064x}/original.webp", "duration_minutes": 45.0,
+        })
+        balance += profit
+    return rows
+
+
+def retained(build):
+    tracemalloc.start()
+    result = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main(sizes):
+    print(f"{'rows':>7} | {'dicts':>9} | {'compact':>9} | {'ratio':>6} | {'build':>8} | {'frame(dicts)':>12} | {'frame(compact)':>14}")
+    print("-" * 82)
+    for n in sizes:
+        rows, dict_bytes = retained(lambda: make_rows(n))
+        history, compact_bytes = retained(lambda: app.TradeHistory.from_rows(rows))
+        _, build_s = timed(lambda: app.TradeHistory.from_rows(rows))
+        _, frame_dicts_s = timed(lambda: app.build_analytics_frame(rows, True))
+        _, frame_compact_s = timed(lambda: app.build_analytics_frame(history, True))
+        assert dict(history[-1]) == rows[-1]
+        print(f"{n:>7} | {dict_bytes / 1e6:>7.1f}MB | {compact_bytes / 1e6:>7.1f}MB | {dict_bytes / compact_bytes:>5.1f}x | "
+              f"{build_s * 1000:>6.0f}ms | {frame_dicts_s * 1000:>10.0f}ms | {frame_compact_s * 1000:>12.0f}ms")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [1_000, 10_000, 50_000])
@@ -0,0 +1,72 @@
+"""Benchmark: archived-row redaction for the Trade History table.
+
+Compares the previous per-row ``df_table.loc[idx, ...]`` loop with
+``app.redact_archived_rows`` at 1k / 10k / 100k rows.
+
+    python benchmarks/bench_history_redaction.py [sizes...]
+"""
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+logging.disable(logging.WARNING) # Streamlit bare-mode warnings
+import app  # noqa: E402  (runs the script once in Streamlit bare mode)
+
+
+def make_frame(n, seed=0):
+    rng = np.random.default_rng(seed)
+    profit = rng.normal(0, 50, n)
+    df = pd.DataFrame({
+        "ticker": pd.Categorical(rng.choice(["BTCUSDT", "ETHUSDT", "SOLUSDT", "XRPUSDT"], n)),
+        "strategy_name": pd.Categorical(rng.choice(["Breakout", "Pullback", "General"], n)),
+        "result_status": pd.Categorical(np.where(profit > 0, "Win", "Loss")),
+        "profit": profit,
+        "roi": profit / 10,
+        "mood": pd.Categorical(rng.choice(["😌 Calm", "😱 FOMO", "🥵 Revenge"], n)),
+    })
+    # Newest-first table of a non-premium user: everything past the recent 20 is locked
+    df["is_locked"] = df.index >= app.RECENT_LIMIT
+    return df
+
+
+def legacy_redact(df):
+    df_table = df.astype({col: object for col in ["ticker", "strategy_name", "result_status", "mood"]})
+    for idx in df_table.index:
+        if df_table.loc[idx, 'is_locked']:
+            df_table.loc[idx, 'ticker'] = "🔒 Archived"
+            df_table.loc[idx, 'strategy_name'] = "****"
+            df_table.loc[idx, 'result_status'] = "Archived"
+            df_table.loc[idx, 'profit'] = 0.0
+            df_table.loc[idx, 'roi'] = 0.0
+            df_table.loc[idx, 'mood'] = "🔒"
+    return df_table
+
+
+def best_of(fn, df, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(df)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main(sizes):
+    print(f"{'rows':>8} | {'legacy loop':>12} | {'vectorized':>12} | {'speedup':>8}")
+    print("-" * 50)
+    for n in sizes:
+        df = make_frame(n)
+        legacy_s, legacy = best_of(legacy_redact, df, 1)
+        fast_s, fast = best_of(app.redact_archived_rows, df, 5)
+        for col in [col for col in app.ARCHIVED_PLACEHOLDERS if col in legacy.columns]:
+            assert (legacy[col].astype(str).to_numpy() == fast[col].astype(str).to_numpy()).all(), col
+        print(f"{n:>8} | {legacy_s * 1000:>10.1f}ms | {fast_s * 1000:>10.2f}ms | {legacy_s / fast_s:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [1_000, 10_000, 100_000])
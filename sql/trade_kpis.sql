@@ -0,0 +1,44 @@
+-- KPI aggregates for the ANALYTICS stage (called via supabase.rpc("trade_kpis", ...)).
+-- Mirrors the pandas fallback in app.py: strategy/ticker filters, period in days,
+-- and the recent-trade window for non-premium users (p_recent_limit = null -> all trades).
+create or replace function trade_kpis(
+    p_user_id text,
+    p_strategies text[] default null,
+    p_tickers text[] default null,
+    p_days int default null,
+    p_recent_limit int default null
+)
+returns table (
+    trade_count bigint,
+    total_profit double precision,
+    win_count bigint,
+    avg_win double precision,
+    avg_loss double precision,
+    avg_holding double precision
+)
+language sql stable
+as $$
+    with scoped as (
+        select
+            coalesce(nullif(strategy_name, ''), 'General') as strategy_name,
+            coalesce(nullif(ticker, ''), 'Unknown') as ticker,
+            entry_time,
+            coalesce(profit, 0) as profit,
+            duration_minutes
+        from trades
+        where user_id = p_user_id
+        order by entry_time desc
+        limit p_recent_limit
+    )
+    select
+        count(*),
+        coalesce(sum(profit), 0),
+        count(*) filter (where profit > 0),
+        coalesce(avg(profit) filter (where profit > 0), 0),
+        coalesce(abs(avg(profit) filter (where profit < 0)), 0),
+        coalesce(avg(duration_minutes), 0)
+    from scoped
+    where (p_strategies is null or strategy_name = any(p_strategies))
+      and (p_tickers is null or ticker = any(p_tickers))
+      and (p_days is null or entry_time >= now() - make_interval(days => p_days));
+$$;
@@ -0,0 +1,2 @@
+-- Finished AI coach feedback is stored on the trade row so it is never regenerated.
+alter table trades add column if not exists ai_feedback text;
@@ -0,0 +1,4 @@
+-- Client-generated key of offline-first saves: replayed inserts are idempotent (upsert on client_id)
+-- and queued updates can target a trade before its server id is known.
+alter table trades add column if not exists client_id text;
+create unique index if not exists trades_client_id_key on trades (client_id);
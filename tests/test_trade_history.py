@@ -0,0 +1,163 @@
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+import pytest
+
+from trade_history import TradeHistory, TradeRow, history_column, history_frame, is_trade_history
+
+
+def make_rows():
+    # Mixed shapes on purpose: missing keys, None, empty strings, offsets, naive times, nested blobs
+    return [
+        {"id": 1, "client_id": "c1", "user_id": "u", "ticker": "BTC", "strategy_name": "Breakout", "mood": "😀",
+         "result_status": "Win", "start_balance": 1000.0, "final_balance": 1100.5, "profit": 100.5, "roi": 10.05,
+         "duration_minutes": 42.0, "satisfaction": 7, "entry_time": "2024-03-01T09:30:00+09:00",
+         "exit_time": "2024-03-01T10:12:00.123456+09:00", "chart_url": "https://cdn/a.webp", "review": "",
+         "memos": [{"time": "09:31", "text": "entry"}]},
+        {"id": 2, "user_id": "u", "ticker": "ETH", "strategy_name": "General", "profit": -20, "roi": -2.0,
+         "entry_time": "2024-03-02T01:00:00-05:30", "exit_time": None, "chart_url": None, "memos": []},
+        {"id": None, "client_id": "local", "user_id": "u", "ticker": "", "mood": None, "profit": 0,
+         "satisfaction": None, "entry_time": "2024-03-02T08:00:00", "review": "리뷰", "extra": {"nested": [1, 2]}},
+        {"id": 4, "user_id": "u", "ticker": "BTC", "strategy_name": "Scalp", "profit": 5.25, "satisfaction": 10,
+         "entry_time": "2024-03-03T00:00:00+00:00", "exit_time": "2024-03-03T00:00:01+00:00"},
+        {"id": 5, "user_id": "u", "ticker": "SOL", "profit": 1.0, "entry_time": "1969-12-31T23:59:59.500000+00:00"},
+    ]
+
+
+def present(row):
+    # What a TradeRow exposes: every key whose value is not None
+    return {key: value for key, value in row.items() if value is not None}
+
+
+def assert_same_rows(history, rows):
+    assert len(history) == len(rows)
+    for view, row in zip(history, rows):
+        assert isinstance(view, TradeRow)
+        assert dict(view) == present(row)
+
+
+def test_from_rows_round_trip():
+    rows = make_rows()
+    history = TradeHistory.from_rows(rows)
+    assert is_trade_history(history)
+    assert_same_rows(history, rows)
+
+
+def test_missing_vs_empty_values():
+    history = TradeHistory.from_rows(make_rows())
+    assert history[0]["review"] == ""           # empty blob is a value
+    assert "review" not in history[1]           # absent key stays absent
+    assert history[2]["ticker"] == ""           # empty label is a value
+    assert "mood" not in history[2]             # None counts as missing
+    assert "exit_time" not in history[1]
+    assert "satisfaction" not in history[2]
+    assert history[1]["memos"] == []
+    assert history[1].get("chart_url") is None
+    with pytest.raises(KeyError):
+        history[1]["chart_url"]
+
+
+def test_integer_columns_stay_integers():
+    history = TradeHistory.from_rows(make_rows())
+    assert history[0]["id"] == 1 and isinstance(history[0]["id"], int)
+    assert history[0]["satisfaction"] == 7 and isinstance(history[0]["satisfaction"], int)
+    assert isinstance(history[1]["profit"], float)
+    assert history.column("satisfaction") == [7, None, None, 10, None]
+    assert history.max_number("id") == 5
+    assert TradeHistory.from_rows([{"ticker": "X"}]).max_number("id") is None
+
+
+def test_timestamp_offsets_and_naive_times():
+    history = TradeHistory.from_rows(make_rows())
+    assert history[0]["exit_time"] == "2024-03-01T10:12:00.123456+09:00"
+    assert history[1]["entry_time"] == "2024-03-02T01:00:00-05:30"
+    assert history[2]["entry_time"] == "2024-03-02T08:00:00"      # naive stays naive
+    assert history[4]["entry_time"] == "1969-12-31T23:59:59.500000+00:00"
+    # Vectorized column formatting matches the per-row path
+    for key in ("entry_time", "exit_time"):
+        assert history.column(key) == [row.get(key) for row in history]
+
+
+def test_datetime_values_are_stored_as_iso_strings():
+    aware = datetime(2024, 5, 1, 12, 0, tzinfo=timezone(timedelta(hours=9)))
+    naive = datetime(2024, 5, 1, 12, 0, 0, 250000)
+    history = TradeHistory.from_rows([{"entry_time": aware}, {"entry_time": naive}])
+    assert history.column("entry_time") == [aware.isoformat(), naive.isoformat()]
+
+
+def test_bad_values_raise():
+    with pytest.raises(ValueError, match="profit"):
+        TradeHistory.from_rows([{"profit": "abc"}])
+    with pytest.raises(ValueError, match="satisfaction"):
+        TradeHistory.from_rows([{"satisfaction": 5.5}])
+    with pytest.raises(ValueError, match="entry_time"):
+        TradeHistory.from_rows([{"entry_time": "yesterday"}])
+    with pytest.raises(ValueError, match="exit_time"):
+        TradeHistory.from_rows([{"exit_time": 1700000000}])
+
+
+@pytest.mark.parametrize("index", [
+    slice(None), slice(1, 4), slice(-3, None), slice(None, -20), slice(3, 1),
+    slice(None, None, 2), slice(1, None, 3), slice(None, None, -1), slice(4, 0, -2),
+])
+def test_take_matches_list_slicing(index):
+    rows = make_rows()
+    history = TradeHistory.from_rows(rows)
+    part = history[index]
+    assert is_trade_history(part)
+    assert_same_rows(part, rows[index])
+    assert part.column("ticker") == [row.get("ticker") for row in rows[index]]
+
+
+def test_negative_and_out_of_range_index():
+    rows = make_rows()
+    history = TradeHistory.from_rows(rows)
+    assert dict(history[-1]) == present(rows[-1])
+    with pytest.raises(IndexError):
+        history[len(rows)]
+    with pytest.raises(IndexError):
+        history[-len(rows) - 1]
+
+
+def test_concat_remaps_labels_and_blobs():
+    rows = make_rows()
+    extra = [{"id": 9, "ticker": "DOGE", "strategy_name": "Breakout", "only_here": "x", "entry_time": "2024-04-01T00:00:00+00:00"}]
+    parts = [TradeHistory.from_rows(rows[:2]), TradeHistory.from_rows([]), TradeHistory.from_rows(rows[2:]), TradeHistory.from_rows(extra)]
+    merged = TradeHistory.concat(parts)
+    assert_same_rows(merged, rows + extra)
+    assert merged.column("only_here") == [None] * len(rows) + ["x"]
+
+
+def test_from_rows_mixes_views_and_dicts():
+    rows = make_rows()
+    history = TradeHistory.from_rows(rows)
+    assert TradeHistory.from_rows(history) is history
+    added = {"id": 6, "ticker": "XRP", "entry_time": "2024-04-02T00:00:00+00:00"}
+    patched = dict(history[2], review="edited")
+    mixed = TradeHistory.from_rows([*history[:2], patched, *history[3:], added])
+    assert_same_rows(mixed, [*rows[:2], dict(rows[2], review="edited"), *rows[3:], added])
+
+
+def normalized(values):
+    return [None if not isinstance(v, list) and pd.isna(v) else v for v in values]
+
+
+def test_to_frame_matches_dataframe_of_dicts():
+    rows = make_rows()
+    history = TradeHistory.from_rows(rows)
+    frame = history.to_frame()
+    expected = pd.DataFrame(rows)
+    assert set(frame.columns) == set(expected.columns)
+    for col in expected.columns:
+        assert normalized(frame[col].tolist()) == normalized(expected[col].tolist()), col
+    assert frame["satisfaction"].dtype == "Int64"
+    assert list(frame.index) == list(range(len(rows)))
+
+
+def test_history_helpers_accept_plain_lists():
+    rows = make_rows()
+    history = TradeHistory.from_rows(rows)
+    assert history_column(rows, "ticker") == history_column(history, "ticker")
+    assert history_frame(rows).shape[0] == history_frame(history).shape[0]
+    assert not is_trade_history(rows)
+    assert TradeHistory.from_rows([]).to_frame().empty
@@ -0,0 +1,304 @@
+# Compact trade history: full_history is held column-wise: interned label codes, float64 numbers, int64
+# epoch-µs timestamps (+ UTC offset), and memos / remaining fields in offset-indexed UTF-8 blobs (JSON unless
+# plain text). Rows are read-only Mapping views, so stages keep using history[-1].get("final_balance"),
+# `'ticker' in row`, slicing etc.
+# Lives outside app.py: Streamlit re-executes the app script on every rerun, while an imported module keeps
+# one TradeHistory class, so histories held in session_state / the shared cache stay isinstance-checkable.
+import sys
+import json
+from datetime import datetime, timedelta, timezone
+from collections.abc import Mapping, Sequence
+
+import numpy as np
+import pandas as pd
+
+TRADE_LABEL_COLUMNS = ["user_id", "ticker", "strategy_name", "mood", "result_status"]
+TRADE_NUMBER_COLUMNS = ["id", "start_balance", "final_balance", "profit", "roi", "duration_minutes", "satisfaction"]
+TRADE_INT_COLUMNS = {"id", "satisfaction"} # Stored as float64 too, handed out as int / nullable Int64
+TRADE_TIME_COLUMNS = ["entry_time", "exit_time"]
+TIME_MISSING = np.iinfo(np.int64).min
+OFFSET_NAIVE = np.iinfo(np.int16).min
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def parse_trade_time(value):
+    # -> (epoch µs, UTC offset minutes); None / NaN count as missing, anything else that is not an ISO
+    # timestamp raises (like a non-numeric value in a number column) instead of silently dropping the time
+    if value is None or (isinstance(value, float) and value != value): return TIME_MISSING, 0
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if not isinstance(value, datetime):
+        raise ValueError(f"not a timestamp: {value!r}")
+    if value.tzinfo is None:
+        return (value.replace(tzinfo=timezone.utc) - EPOCH) // timedelta(microseconds=1), OFFSET_NAIVE
+    return (value - EPOCH) // timedelta(microseconds=1), int(value.utcoffset() // timedelta(minutes=1))
+
+def format_trade_time(us, offset):
+    if us == TIME_MISSING: return None
+    if offset == OFFSET_NAIVE:
+        return (EPOCH + timedelta(microseconds=int(us))).replace(tzinfo=None).isoformat()
+    return (EPOCH + timedelta(microseconds=int(us))).astimezone(timezone(timedelta(minutes=int(offset)))).isoformat()
+
+def format_trade_times(us, offsets):
+    # Vectorized format_trade_time (same isoformat output) for whole columns
+    missing, naive = us == TIME_MISSING, offsets == OFFSET_NAIVE
+    us = np.where(missing, 0, us)
+    offset_min = np.where(naive, 0, offsets).astype(np.int64)
+    text = np.datetime_as_string((us + offset_min * 60_000_000).astype("datetime64[us]"), unit="s")
+    micro = us % 1_000_000
+    frac = np.where(micro != 0, np.char.add(".", np.char.zfill(micro.astype(str), 6)), "")
+    sign = np.where(offset_min < 0, "-", "+")
+    hours, minutes = np.divmod(np.abs(offset_min), 60)
+    tz = np.char.add(np.char.add(np.char.add(sign, np.char.zfill(hours.astype(str), 2)), ":"), np.char.zfill(minutes.astype(str), 2))
+    result = np.char.add(np.char.add(text, frac), np.where(naive, "", tz)).astype(object)
+    result[missing] = None
+    return result
+
+def time_column(rows, col):
+    # -> (int64 epoch µs, int16 UTC offset minutes)
+    try:
+        parsed = [parse_trade_time(row.get(col)) for row in rows]
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Trade column {col!r} holds an unparseable timestamp: {e}") from None
+    return (np.fromiter((us for us, _ in parsed), dtype=np.int64, count=len(parsed)),
+            np.fromiter((off for _, off in parsed), dtype=np.int16, count=len(parsed)))
+
+def number_column(rows, col):
+    # -> float64 (NaN = missing); a value that is not a number raises instead of silently becoming NaN
+    try:
+        numbers = pd.to_numeric(pd.Series([row.get(col) for row in rows], dtype=object)).to_numpy(dtype="float64")
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Trade column {col!r} holds a non-numeric value: {e}") from None
+    if col in TRADE_INT_COLUMNS and not np.array_equal(numbers, np.trunc(numbers), equal_nan=True):
+        raise ValueError(f"Trade column {col!r} holds a non-integer value")
+    return numbers
+
+def encode_blob_value(value):
+    # 1-byte tag: plain strings skip JSON (the common case: chart_url, client_id, review...)
+    if isinstance(value, str): return b"s" + value.encode("utf-8")
+    return b"j" + json.dumps(value, default=str, ensure_ascii=False).encode("utf-8")
+
+def decode_blob_value(chunk):
+    return chunk[1:].decode("utf-8") if chunk[:1] == b"s" else json.loads(chunk[1:])
+
+class TradeRow(Mapping):
+    __slots__ = ("_history", "_i")
+
+    def __init__(self, history, i):
+        self._history = history
+        self._i = i
+
+    def __getitem__(self, key):
+        return self._history._value(self._i, key)
+
+    def __iter__(self):
+        return iter(self._history._row_keys(self._i))
+
+    def __len__(self):
+        return len(self._history._row_keys(self._i))
+
+    def __repr__(self):
+        return repr(dict(self))
+
+class TradeHistory(Sequence):
+    # Immutable; build with TradeHistory.from_rows(rows) (rows may mix dicts and TradeRow views)
+    __slots__ = ("_n", "_codes", "_vocab", "_numbers", "_times", "_offsets", "_blobs")
+
+    def __init__(self, n, codes, vocab, numbers, times, offsets, blobs):
+        self._n = n
+        self._codes = codes     # label -> int32 codes (-1 = missing)
+        self._vocab = vocab     # label -> tuple of interned strings
+        self._numbers = numbers # column -> float64 (NaN = missing)
+        self._times = times     # column -> int64 epoch µs (TIME_MISSING = missing)
+        self._offsets = offsets # column -> int16 UTC offset minutes
+        self._blobs = blobs     # key -> (utf-8 bytes, int64 offsets[n + 1]); empty slice = missing
+
+    @classmethod
+    def _build(cls, rows):
+        n = len(rows)
+        codes, vocab = {}, {}
+        for col in TRADE_LABEL_COLUMNS:
+            index = {}
+            codes[col] = np.fromiter((-1 if not isinstance(row.get(col), str) else index.setdefault(sys.intern(row[col]), len(index))
+                                      for row in rows), dtype=np.int32, count=n)
+            vocab[col] = tuple(index)
+        numbers = {col: number_column(rows, col) for col in TRADE_NUMBER_COLUMNS}
+        times, offsets = {}, {}
+        for col in TRADE_TIME_COLUMNS:
+            times[col], offsets[col] = time_column(rows, col)
+        fixed = set(TRADE_LABEL_COLUMNS) | set(TRADE_NUMBER_COLUMNS) | set(TRADE_TIME_COLUMNS)
+        parts = {}
+        for i, row in enumerate(rows):
+            for key, value in row.items():
+                if key in fixed or value is None: continue # None counts as missing, like NaN in the typed columns
+                if key not in parts: parts[key] = [b""] * n
+                parts[key][i] = encode_blob_value(value)
+        blobs = {}
+        for key, chunks in parts.items():
+            offsets_arr = np.zeros(n + 1, dtype=np.int64)
+            np.cumsum([len(chunk) for chunk in chunks], out=offsets_arr[1:])
+            blobs[key] = (b"".join(chunks), offsets_arr)
+        return cls(n, codes, vocab, numbers, times, offsets, blobs)
+
+    @classmethod
+    def from_rows(cls, rows):
+        # Runs of consecutive views of one history are copied column-wise; plain dicts are encoded
+        if is_trade_history(rows): return rows
+        parts, pending, run = [], [], None
+        for row in rows:
+            if isinstance(row, TradeRow):
+                if run and run[0] is row._history and run[2] == row._i:
+                    run[2] += 1
+                    continue
+                if pending: parts.append(cls._build(pending)); pending = []
+                if run: parts.append(run[0][run[1]:run[2]])
+                run = [row._history, row._i, row._i + 1]
+            else:
+                if run: parts.append(run[0][run[1]:run[2]]); run = None
+                pending.append(row)
+        if pending: parts.append(cls._build(pending))
+        if run: parts.append(run[0][run[1]:run[2]])
+        return cls.concat(parts)
+
+    @classmethod
+    def concat(cls, parts):
+        parts = [part for part in parts if len(part)]
+        if len(parts) == 1: return parts[0]
+        if not parts: return cls._build([])
+        n = sum(part._n for part in parts)
+        codes, vocab = {}, {}
+        for col in TRADE_LABEL_COLUMNS:
+            index = {}
+            remapped = []
+            for part in parts:
+                mapping = np.array([index.setdefault(value, len(index)) for value in part._vocab[col]] + [-1], dtype=np.int32)
+                remapped.append(mapping[part._codes[col]]) # code -1 picks the trailing -1
+            codes[col], vocab[col] = np.concatenate(remapped), tuple(index)
+        numbers = {col: np.concatenate([part._numbers[col] for part in parts]) for col in TRADE_NUMBER_COLUMNS}
+        times = {col: np.concatenate([part._times[col] for part in parts]) for col in TRADE_TIME_COLUMNS}
+        offsets = {col: np.concatenate([part._offsets[col] for part in parts]) for col in TRADE_TIME_COLUMNS}
+        blobs = {}
+        for key in dict.fromkeys(key for part in parts for key in part._blobs):
+            datas, offset_arrays, base = [], [np.zeros(1, dtype=np.int64)], 0
+            for part in parts:
+                data, offs = part._blobs.get(key, (b"", np.zeros(part._n + 1, dtype=np.int64)))
+                datas.append(data)
+                offset_arrays.append(offs[1:] + base)
+                base += len(data)
+            blobs[key] = (b"".join(datas), np.concatenate(offset_arrays))
+        return cls(n, codes, vocab, numbers, times, offsets, blobs)
+
+    def __len__(self):
+        return self._n
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self._take(range(self._n)[i])
+        if i < 0: i += self._n
+        if not 0 <= i < self._n: raise IndexError("trade index out of range")
+        return TradeRow(self, i)
+
+    def _take(self, positions):
+        if positions.step == 1 or len(positions) <= 1:
+            start, stop = (positions[0], positions[-1] + 1) if len(positions) else (0, 0)
+            idx = slice(start, stop)
+            blobs = {key: (data[offs[start]:offs[stop]], offs[start:stop + 1] - offs[start]) for key, (data, offs) in self._blobs.items()}
+        else:
+            idx = np.asarray(positions, dtype=np.int64)
+            blobs = {}
+            for key, (data, offs) in self._blobs.items():
+                chunks = [data[offs[i]:offs[i + 1]] for i in idx]
+                new_offs = np.zeros(len(idx) + 1, dtype=np.int64)
+                np.cumsum([len(chunk) for chunk in chunks], out=new_offs[1:])
+                blobs[key] = (b"".join(chunks), new_offs)
+        return TradeHistory(len(positions), {col: codes[idx] for col, codes in self._codes.items()}, self._vocab,
+                            {col: arr[idx] for col, arr in self._numbers.items()},
+                            {col: arr[idx] for col, arr in self._times.items()},
+                            {col: arr[idx] for col, arr in self._offsets.items()}, blobs)
+
+    def _value(self, i, key):
+        if key in self._codes:
+            code = self._codes[key][i]
+            if code < 0: raise KeyError(key)
+            return self._vocab[key][code]
+        if key in self._numbers:
+            value = self._numbers[key][i]
+            if np.isnan(value): raise KeyError(key)
+            return int(value) if key in TRADE_INT_COLUMNS else float(value)
+        if key in self._times:
+            if self._times[key][i] == TIME_MISSING: raise KeyError(key)
+            return format_trade_time(self._times[key][i], self._offsets[key][i])
+        if key in self._blobs:
+            data, offs = self._blobs[key]
+            if offs[i] == offs[i + 1]: raise KeyError(key)
+            return decode_blob_value(data[offs[i]:offs[i + 1]])
+        raise KeyError(key)
+
+    def _row_keys(self, i):
+        keys = [col for col, codes in self._codes.items() if codes[i] >= 0]
+        keys += [col for col, arr in self._numbers.items() if not np.isnan(arr[i])]
+        keys += [col for col, arr in self._times.items() if arr[i] != TIME_MISSING]
+        keys += [key for key, (_, offs) in self._blobs.items() if offs[i] != offs[i + 1]]
+        return keys
+
+    @property
+    def nbytes(self):
+        arrays = [*self._codes.values(), *self._numbers.values(), *self._times.values(), *self._offsets.values()]
+        return (sum(arr.nbytes for arr in arrays) + sum(len(data) + offs.nbytes for data, offs in self._blobs.values())
+                + sum(sys.getsizeof(value) for vocab in self._vocab.values() for value in vocab))
+
+    def max_number(self, key):
+        # Largest value of a number column (None when no row has one), e.g. the highest server id
+        values = self._numbers[key]
+        if np.isnan(values).all(): return None
+        value = np.nanmax(values)
+        return int(value) if key in TRADE_INT_COLUMNS else float(value)
+
+    def column(self, key):
+        # All values of one field (None where missing), without building row views
+        if key in self._codes:
+            return object_array([*self._vocab[key], None])[self._codes[key]].tolist()
+        if key in self._numbers:
+            values = self._numbers[key].tolist()
+            return [None if v != v else (int(v) if key in TRADE_INT_COLUMNS else v) for v in values]
+        if key in self._times:
+            return format_trade_times(self._times[key], self._offsets[key]).tolist()
+        if key in self._blobs:
+            data, offs = self._blobs[key]
+            bounds = offs.tolist()
+            return [decode_blob_value(data[s:e]) if e > s else None for s, e in zip(bounds[:-1], bounds[1:])]
+        return [None] * self._n
+
+    def to_frame(self):
+        # Column-wise DataFrame (same columns/values as pd.DataFrame(list_of_dicts), missing -> NaN/None);
+        # satisfaction is a nullable Int64 score, not a float
+        data = {}
+        for col in TRADE_LABEL_COLUMNS:
+            if (self._codes[col] >= 0).any():
+                data[col] = object_array([*self._vocab[col], None])[self._codes[col]]
+        for col in TRADE_NUMBER_COLUMNS:
+            if not np.isnan(self._numbers[col]).all():
+                data[col] = pd.array(self._numbers[col], dtype="Int64") if col == "satisfaction" else self._numbers[col]
+        for col in TRADE_TIME_COLUMNS:
+            times, offsets = self._times[col], self._offsets[col]
+            if (times != TIME_MISSING).any():
+                data[col] = format_trade_times(times, offsets)
+        for key, (blob, offs) in self._blobs.items():
+            bounds = offs.tolist()
+            data[key] = object_array([decode_blob_value(blob[s:e]) if e > s else None for s, e in zip(bounds[:-1], bounds[1:])])
+        return pd.DataFrame(data, index=pd.RangeIndex(self._n))
+
+def object_array(values):
+    # 1-D object array even when the values are equal-length lists (memos)
+    arr = np.empty(len(values), dtype=object)
+    arr[:] = values
+    return arr
+
+def is_trade_history(rows):
+    return isinstance(rows, TradeHistory)
+
+def history_column(rows, key):
+    return rows.column(key) if is_trade_history(rows) else [row.get(key) for row in rows]
+
+def history_frame(rows):
+    if is_trade_history(rows): return rows.to_frame()
+    return rows if isinstance(rows, pd.DataFrame) else pd.DataFrame(list(rows))